@@ -0,0 +1,62 @@
+import io
+import statistics
+import time
+
+from PIL import Image
+
+from sd_controls.encoder import EncodeQuality, JpegEncoder
+from sd_controls.profiles import STREAMDECK_MK2
+from sd_controls.sdsystem import SDUserApp, Sprites
+
+_ROUNDS = 20
+
+
+def _pillow_default(image: Image.Image) -> bytes:
+    # what HardwareStreamDeck.encode_image used to do
+    img_byte_buffer = io.BytesIO()
+    image.save(img_byte_buffer, format="JPEG")
+    return img_byte_buffer.getvalue()
+
+
+def _images() -> dict[str, Image.Image]:
+    size = (STREAMDECK_MK2.icon_size, STREAMDECK_MK2.icon_size)
+    images = {
+        "clear": Sprites.CLEAR,
+        "back": Sprites.BACK_BTN,
+        "goat": Sprites.GOAT,
+        "goat labeled": SDUserApp.generate_labeled_img(Sprites.GOAT, "Goat"),
+        "text": SDUserApp.generate_labeled_img(Sprites.CLEAR, "Volume 42%"),
+    }
+    return {name: image.convert("RGB").resize(size) for name, image in images.items()}
+
+
+def _measure(encode, image: Image.Image) -> tuple[int, float]:
+    durations = []
+    for _ in range(_ROUNDS):
+        start = time.perf_counter()
+        encoded = encode(image)
+        durations.append(time.perf_counter() - start)
+    return len(encoded), statistics.median(durations) * 1000
+
+
+def main() -> None:
+    encoder = JpegEncoder(STREAMDECK_MK2.icon_size, STREAMDECK_MK2.image_payload_length)
+    encoders = {"default": _pillow_default}
+    for quality in EncodeQuality:
+        encoders[quality.name.lower()] = lambda image, quality=quality: encoder.encode(image, quality)
+
+    print(f"{'image':<16}" + "".join(f"{name:>24}" for name in encoders))
+    totals = dict.fromkeys(encoders, 0)
+    for image_name, image in _images().items():
+        line = f"{image_name:<16}"
+        for name, encode in encoders.items():
+            length, encode_ms = _measure(encode, image)
+            packets = encoder.packet_count(length)
+            totals[name] += packets
+            line += f"{packets:>4} pkt {length:>6} B {encode_ms:>5.2f} ms"
+        print(line)
+    print(f"{'packets total':<16}" + "".join(f"{total:>24}" for total in totals.values()))
+
+
+if __name__ == "__main__":
+    main()
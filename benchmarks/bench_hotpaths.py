@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from PIL import Image
+
+from sd_controls.fakedevice import FakeHIDDevice
+from sd_controls.framecache import FrameCache
+from sd_controls.sdsystem import SDSystem, SDUserApp, Sprites
+from sd_controls.streamdeck import ReadMode, StreamDeckMk2
+
+_BASELINE_PATH = Path(__file__).parent / "baseline.json"
+# relative change against the baseline which counts as a regression
+_REGRESSION_THRESHOLD = 0.2
+
+
+class _BenchApp(SDUserApp):
+    def __init__(self, index: int) -> None:
+        super().__init__(f"Bench {index}")
+        self._icon = SDUserApp.generate_labeled_img(Sprites.GOAT, f"App {index}")
+        self.on_down: Callable[[], None] | None = None
+
+    def get_icon(self) -> Image.Image:
+        return self._icon
+
+    def init(self) -> None:
+        super().init()
+        self.setup_key(1, down=self._down)
+
+    def _down(self) -> None:
+        if self.on_down:
+            self.on_down()
+
+
+def _images(prefix: str, count: int) -> list[Image.Image]:
+    return [SDUserApp.generate_labeled_img(Sprites.GOAT, f"{prefix}{i}") for i in range(count)]
+
+
+def _system(write_latency: float, read_mode: ReadMode = ReadMode.POLLING) -> tuple[SDSystem, FakeHIDDevice]:
+    device = FakeHIDDevice(write_latency=write_latency, keep_writes=False)
+    deck = StreamDeckMk2(device, read_mode=read_mode, read_timeout=100, frame_cache=FrameCache())
+    system = SDSystem(deck=deck)
+    for index in range(system.get_key_count() - 1):
+        system.register_app(_BenchApp(index))
+    system.close_app()
+    return system, device
+
+
+def bench_upload(write_latency: float) -> dict[str, float]:
+    system, _ = _system(write_latency)
+    keys = range(1, system.get_key_count())
+    cold = _images("cold", 210)
+    start = time.perf_counter()
+    for index, image in enumerate(cold):
+        system.set_key(keys[index % len(keys)], image)
+    cold_rate = len(cold) / (time.perf_counter() - start)
+
+    # alternating between two prepared sets: every write changes the key but hits the frame cache
+    warm = [_images("warm-a", len(keys)), _images("warm-b", len(keys))]
+    for images in warm:
+        system.set_keys(dict(zip(keys, images)))
+    writes = 0
+    start = time.perf_counter()
+    for round_index in range(15):
+        for key, image in zip(keys, warm[round_index % 2]):
+            system.set_key(key, image)
+            writes += 1
+    warm_rate = writes / (time.perf_counter() - start)
+    system.close()
+    return {"upload_keys_per_s": cold_rate, "upload_cached_keys_per_s": warm_rate}
+
+
+def bench_full_redraw(write_latency: float, rounds: int = 10) -> dict[str, float]:
+    system, _ = _system(write_latency)
+    keys = range(1, system.get_key_count())
+    durations = []
+    for round_index in range(rounds):
+        images = dict(zip(keys, _images(f"redraw{round_index}-", len(keys))))
+        start = time.perf_counter()
+        system.set_keys(images)
+        durations.append(time.perf_counter() - start)
+    system.close()
+    return {"full_redraw_ms": statistics.median(durations) * 1000}
+
+
+def bench_app_switch(write_latency: float, rounds: int = 20) -> dict[str, float]:
+    system, _ = _system(write_latency)
+    apps = system.get_apps()
+    durations = []
+    for round_index in range(rounds):
+        system._start_app(apps[round_index % len(apps)])
+        start = time.perf_counter()
+        system.close_app()
+        durations.append(time.perf_counter() - start)
+    system.close()
+    return {"app_switch_ms": statistics.median(durations) * 1000}
+
+
+async def _input_latency(write_latency: float, read_mode: ReadMode, presses: int) -> float:
+    system, device = _system(write_latency, read_mode)
+    deck = system.get_deck()
+    runner = asyncio.create_task(deck.run())
+
+    app = system.get_apps()[0]
+    system._start_app(app)
+    latencies = []
+    received = asyncio.Event()
+    sent_at = 0.0
+
+    def on_down() -> None:
+        latencies.append(time.perf_counter() - sent_at)
+        received.set()
+
+    app.on_down = on_down
+    for _ in range(presses):
+        received.clear()
+        sent_at = time.perf_counter()
+        device.push_keys(1 << 1)
+        await asyncio.wait_for(received.wait(), 1)
+        device.push_keys(0)
+        await asyncio.sleep(0.002)
+
+    system.close()
+    await runner
+    return statistics.median(latencies) * 1000
+
+
+async def _idle_cpu(read_mode: ReadMode, seconds: float) -> float:
+    system, _ = _system(0.0, read_mode)
+    deck = system.get_deck()
+    runner = asyncio.create_task(deck.run())
+    start = time.process_time()
+    await asyncio.sleep(seconds)
+    cpu = (time.process_time() - start) / seconds
+    system.close()
+    await runner
+    return cpu * 100
+
+
+def bench_input(write_latency: float, presses: int = 100, idle_seconds: float = 1.0) -> dict[str, float]:
+    results = {}
+    for read_mode in ReadMode:
+        mode = read_mode.name.lower()
+        results[f"input_latency_{mode}_ms"] = asyncio.run(_input_latency(write_latency, read_mode, presses))
+        results[f"idle_cpu_{mode}_percent"] = asyncio.run(_idle_cpu(read_mode, idle_seconds))
+    return results
+
+
+def _higher_is_better(name: str) -> bool:
+    return name.endswith("_per_s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the sd_controls hot paths against a simulated deck")
+    parser.add_argument("--write-latency", type=float, default=0.001, help="simulated seconds per HID write")
+    parser.add_argument("--baseline", type=Path, default=_BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for bench in (bench_upload, bench_full_redraw, bench_app_switch, bench_input):
+        results.update(bench(args.write_latency))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = []
+    print(f"{'benchmark':<32}{'result':>12}{'baseline':>12}{'change':>10}")
+    for name, value in results.items():
+        line = f"{name:<32}{value:>12.3f}"
+        if name in baseline and baseline[name]:
+            change = (value - baseline[name]) / baseline[name]
+            line += f"{baseline[name]:>12.3f}{change:>+10.1%}"
+            if (-change if _higher_is_better(name) else change) > _REGRESSION_THRESHOLD:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print("Saved baseline to", args.baseline)
+    elif regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import random
+import statistics
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+from sd_controls.sdsystem import SDUserApp, Sprites
+
+_ROUNDS = 5
+# live values as shown by dashboards, most labels differ from the previous one
+_LABELS = [f"CPU {value}%" for value in range(100)]
+_LABELS += [f"{minute:02}:{second:02}" for minute in range(3) for second in range(60)]
+
+
+def _pillow_label(base: Image.Image, label: str) -> Image.Image:
+    # what SDUserApp.generate_labeled_img did before the glyph atlas
+    labeled_img = base.copy()
+    draw = ImageDraw.Draw(labeled_img)
+    font = SDUserApp.font(14)
+    bbox = draw.textbbox((36, 52), label, font=font, anchor="mm", align="center")
+    draw.rectangle(bbox, fill="#00000080")
+    draw.text((36, 52), label, (255, 255, 255), font=font, anchor="mm", align="center")
+    return labeled_img
+
+
+def _atlas_label(base: Image.Image, label: str) -> Image.Image:
+    # bypasses the memoization of generate_labeled_img
+    return SDUserApp._labeled_img(base, random.randbytes(16), label, (36, 52), (255, 255, 255), 14, "#00000080")
+
+
+def _measure(render) -> float:
+    durations = []
+    for _ in range(_ROUNDS):
+        start = time.perf_counter()
+        for label in _LABELS:
+            render(Sprites.GOAT, label)
+        durations.append((time.perf_counter() - start) / len(_LABELS))
+    return statistics.median(durations) * 1e6
+
+
+def main() -> None:
+    mismatches = [
+        label
+        for label in _LABELS
+        if _pillow_label(Sprites.GOAT, label).tobytes() != _atlas_label(Sprites.GOAT, label).tobytes()
+    ]
+    pillow = _measure(_pillow_label)
+    atlas = _measure(_atlas_label)
+    print(f"pillow text      {pillow:>8.1f} us per label")
+    print(f"glyph atlas      {atlas:>8.1f} us per label ({pillow / atlas:.1f}x)")
+    print(f"identical output {len(_LABELS) - len(mismatches)}/{len(_LABELS)}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
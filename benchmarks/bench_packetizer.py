@@ -0,0 +1,75 @@
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from sd_controls.fakedevice import FakeHIDDevice
+from sd_controls.streamdeck import StreamDeckMk2
+
+_ROUNDS = 2000
+# encoded image sizes from one to five packets
+_IMAGE_SIZES = (900, 1800, 3000, 5000)
+
+
+def _legacy_build_packets(deck: StreamDeckMk2, key: int, img_bytes: bytes) -> tuple[bytes, ...]:
+    # the packetizer before the header was a precompiled struct and the padding came from a shared buffer
+    max_payload_length = deck.get_profile().image_payload_length
+    packets = []
+    package = 0
+    offset = 0
+    remaining_data = len(img_bytes)
+    while remaining_data > 0:
+        payload_length = min(max_payload_length, remaining_data)
+        remaining_data -= payload_length
+        header = deck._get_send_image_command_header(key, remaining_data == 0, payload_length, package)
+        packets.append(
+            header + img_bytes[offset : offset + payload_length] + bytes([0x0] * (max_payload_length - payload_length))
+        )
+        offset += payload_length
+        package += 1
+    return tuple(packets)
+
+
+def _measure(build, deck: StreamDeckMk2, img_bytes: bytes) -> tuple[float, int, int]:
+    durations = []
+    for _ in range(_ROUNDS):
+        start = time.perf_counter()
+        build(deck, 3, img_bytes)
+        durations.append(time.perf_counter() - start)
+
+    # memory blocks still allocated afterwards, i.e. held by the resulting packets
+    gc.disable()
+    blocks_before = sys.getallocatedblocks()
+    packets = build(deck, 3, img_bytes)
+    blocks = sys.getallocatedblocks() - blocks_before
+    gc.enable()
+    del packets
+
+    # peak of the memory allocated on the way that is not part of the resulting packets
+    tracemalloc.start()
+    packets = build(deck, 3, img_bytes)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del packets
+    return statistics.median(durations) * 1e6, blocks, peak - retained
+
+
+def main() -> None:
+    deck = StreamDeckMk2(FakeHIDDevice())
+    builders = {"legacy": _legacy_build_packets, "current": StreamDeckMk2._build_packets}
+    print(f"{'image bytes':<12}" + "".join(f"{name:>38}" for name in builders))
+    for size in _IMAGE_SIZES:
+        img_bytes = os.urandom(size)
+        if _legacy_build_packets(deck, 3, img_bytes) != deck._build_packets(3, img_bytes):
+            raise RuntimeError(f"The packetizers disagree for {size} bytes")
+        line = f"{size:<12}"
+        for build in builders.values():
+            micros, blocks, transient = _measure(build, deck, img_bytes)
+            line += f"{micros:>9.2f} us {blocks:>4} blocks {transient:>7} B temp"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
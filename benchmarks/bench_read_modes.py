@@ -0,0 +1,52 @@
+import asyncio
+import statistics
+import time
+
+from sd_controls.fakedevice import FakeHIDDevice
+from sd_controls.streamdeck import ReadMode, StreamDeck, StreamDeckMk2
+
+_IDLE_SECONDS = 2.0
+_PRESSES = 200
+
+
+async def _measure(read_mode: ReadMode) -> tuple[float, list[float]]:
+    device = FakeHIDDevice()
+    deck = StreamDeckMk2(device, read_mode=read_mode)
+    latencies = []
+    sent_at = 0.0
+    received = asyncio.Event()
+
+    def listener(_: StreamDeck, keys_before: list[bool], keys: list[bool]) -> None:
+        latencies.append(time.perf_counter() - sent_at)
+        received.set()
+
+    deck.add_event_listener(listener)
+    runner = asyncio.create_task(deck.run())
+
+    cpu_start = time.process_time()
+    await asyncio.sleep(_IDLE_SECONDS)
+    idle_cpu = (time.process_time() - cpu_start) / _IDLE_SECONDS
+
+    for press in range(_PRESSES):
+        received.clear()
+        sent_at = time.perf_counter()
+        device.push_keys([press % 2 == 0] * deck.get_key_count())
+        await received.wait()
+
+    deck.stop()
+    await runner
+    return idle_cpu, latencies
+
+
+def main() -> None:
+    print(f"{'mode':<10}{'idle cpu':>10}{'p50 latency':>14}{'p99 latency':>14}")
+    for read_mode in ReadMode:
+        idle_cpu, latencies = asyncio.run(_measure(read_mode))
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        print(f"{read_mode.name:<10}{idle_cpu:>9.1%}{p50:>12.3f}ms{p99:>12.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from sd_controls.fakedevice import FakeHIDDevice
+from sd_controls.framecache import FrameCache
+from sd_controls.remote import RemoteClient
+from sd_controls.sdsystem import SDSystem, SDUserApp, Sprites
+from sd_controls.streamdeck import ReadMode, StreamDeckMk2
+
+# key which is pressed to measure the event latency while the clients write images
+_EVENT_KEY = 3
+
+
+class _PassiveApp(SDUserApp):
+    def __init__(self) -> None:
+        super().__init__("Remote", "remote")
+
+    def get_icon(self) -> Image.Image:
+        return Sprites.GOAT
+
+
+async def _client_load(path: Path, client_index: int, requests: int, packets: bool) -> list[float]:
+    client = await RemoteClient.connect(path)
+    usable_keys = range(1, client.key_count)
+    # two images per key, so every request changes what the key shows
+    images = [
+        [
+            client.encode_image(SDUserApp.generate_labeled_img(Sprites.GOAT, f"{client_index}.{key}.{variant}"))
+            for key in usable_keys
+        ]
+        for variant in range(2)
+    ]
+    latencies = []
+    for request in range(requests):
+        key_index = request % len(usable_keys)
+        key = usable_keys[key_index]
+        jpeg = images[request // len(usable_keys) % 2][key_index]
+        start = time.perf_counter()
+        if packets:
+            result = await client.set_key_packets(key, client.build_packets(key, jpeg))
+        else:
+            result = await client.set_key_jpeg(key, jpeg)
+        latencies.append(time.perf_counter() - start)
+        if not result:
+            raise RuntimeError(f"Request {request} of client {client_index} failed")
+    await client.close()
+    return latencies
+
+
+async def _event_latency(path: Path, device: FakeHIDDevice, presses: int, done: asyncio.Event) -> list[float]:
+    client = await RemoteClient.connect(path)
+    await client.subscribe()
+    events = client.events()
+    latencies = []
+    while not done.is_set() and len(latencies) < presses:
+        start = time.perf_counter()
+        device.push_keys(1 << _EVENT_KEY)
+        await anext(events)
+        latencies.append(time.perf_counter() - start)
+        device.push_keys(0)
+        await anext(events)
+        await asyncio.sleep(0.005)
+    await client.close()
+    return latencies
+
+
+async def _bench(args: argparse.Namespace) -> None:
+    device = FakeHIDDevice(write_latency=args.write_latency, keep_writes=False)
+    deck = StreamDeckMk2(
+        device, read_mode=ReadMode.THREAD, read_timeout=100, frame_cache=FrameCache(), write_thread=True
+    )
+    system = SDSystem(deck=deck)
+    system.register_app(_PassiveApp())
+    runner = asyncio.create_task(system.run())
+    path = Path(tempfile.mkdtemp()) / "sd-controls.sock"
+    server = await system.serve_remote(path)
+
+    control = await RemoteClient.connect(path)
+    if not await control.launch_app("remote"):
+        raise RuntimeError("Could not launch the app")
+
+    done = asyncio.Event()
+    event_task = asyncio.create_task(_event_latency(path, device, args.presses, done))
+    start = time.perf_counter()
+    loads = await asyncio.gather(
+        *(_client_load(path, index, args.requests, args.packets) for index in range(args.clients))
+    )
+    duration = time.perf_counter() - start
+    done.set()
+    event_latencies = await event_task
+
+    await control.close()
+    server.close()
+    system.close()
+    await runner
+
+    latencies = sorted(latency for load in loads for latency in load)
+    mode = "packets" if args.packets else "jpeg"
+    print(f"{args.clients} clients x {args.requests} {mode} requests in {duration:.2f} s")
+    print(f"throughput               {len(latencies) / duration:>8.0f} keys/s")
+    print(f"request latency p50      {statistics.median(latencies) * 1000:>8.2f} ms")
+    print(f"request latency p99      {latencies[int(len(latencies) * 0.99)] * 1000:>8.2f} ms")
+    if event_latencies:
+        print(f"key event latency p50    {statistics.median(event_latencies) * 1000:>8.2f} ms under load")
+        print(f"key event latency max    {max(event_latencies) * 1000:>8.2f} ms under load")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the remote control socket against a fake deck")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="key images per client")
+    parser.add_argument("--packets", action="store_true", help="send packetized reports instead of JPEGs")
+    parser.add_argument("--presses", type=int, default=100, help="key presses during the load")
+    parser.add_argument("--write-latency", type=float, default=0.0002, help="simulated seconds per HID write")
+    asyncio.run(_bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
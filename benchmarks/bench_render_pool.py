@@ -0,0 +1,100 @@
+import argparse
+import os
+import time
+from concurrent.futures import Future
+
+from PIL import Image
+
+from sd_controls.fakedevice import FakeHIDDevice
+from sd_controls.framecache import FrameCache
+from sd_controls.profiles import STREAMDECK_MK2, STREAMDECK_XL
+from sd_controls.renderpool import RenderPool
+from sd_controls.sdsystem import SDSystem, SDUserApp, Sprites
+from sd_controls.streamdeck import HardwareStreamDeck
+
+# apps usually pass artwork larger than the keys, so every image is resized
+_SOURCE_SIZE = 256
+
+
+def _create_systems(decks: int, pool: RenderPool | None, write_latency: float) -> list[SDSystem]:
+    systems = []
+    for index in range(decks):
+        profile = STREAMDECK_XL if index % 2 else STREAMDECK_MK2
+        device = FakeHIDDevice.for_profile(profile, write_latency=write_latency, keep_writes=False)
+        deck = HardwareStreamDeck(device, profile, frame_cache=FrameCache(), write_thread=True)
+        systems.append(SDSystem(deck=deck, render_pool=pool))
+    return systems
+
+
+def _redraws(systems: list[SDSystem], rounds: int) -> list[list[dict[int, Image.Image]]]:
+    # labels are drawn up front, only the render stage is measured
+    base = Sprites.GOAT.resize((_SOURCE_SIZE, _SOURCE_SIZE))
+    return [
+        [
+            {
+                key: SDUserApp.generate_labeled_img(base, f"{deck}.{key}.{redraw}", (128, 200), font_size=40)
+                for key in range(system.get_key_count())
+            }
+            for deck, system in enumerate(systems)
+        ]
+        for redraw in range(rounds)
+    ]
+
+
+def _run(systems: list[SDSystem], redraws: list[list[dict[int, Image.Image]]]) -> tuple[float, float, int]:
+    """
+    Redraws every key of every deck, returns the total and the submitting time and the number of keys
+    """
+    submit_time = 0.0
+    keys = 0
+    start = time.perf_counter()
+    for redraw in redraws:
+        pending = []
+        for system, images in zip(systems, redraw):
+            submit_start = time.perf_counter()
+            results = system.set_keys(images)
+            submit_time += time.perf_counter() - submit_start
+            pending += [result for result in results.values() if isinstance(result, Future)]
+            keys += len(images)
+        for result in pending:
+            if not result.result():
+                raise RuntimeError("A key image was not written")
+    return time.perf_counter() - start, submit_time, keys
+
+
+def _measure(args: argparse.Namespace, workers: int | None) -> tuple[float, float, int]:
+    pool = RenderPool(workers, processes=not args.threads) if workers else None
+    systems = _create_systems(args.decks, pool, args.write_latency)
+    # starts the workers and fills the encoders outside of the measurement
+    _run(systems, _redraws(systems, 1))
+    result = _run(systems, _redraws(systems, args.rounds))
+    if pool is not None:
+        pool.close()
+    for system in systems:
+        system.close()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Full redraws of several fake decks with and without a render pool")
+    parser.add_argument("--decks", type=int, default=4, help="alternating Mk.2 and XL decks")
+    parser.add_argument("--rounds", type=int, default=5, help="full redraws of all decks")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", action="store_true", help="render on threads instead of processes")
+    parser.add_argument("--write-latency", type=float, default=0.0, help="simulated seconds per HID write")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.decks} decks, {args.rounds} redraws")
+    inline_time, inline_submit, keys = _measure(args, None)
+    print(f"{'inline':<12} {keys / inline_time:>8.0f} keys/s   loop busy {inline_submit * 1000:>8.1f} ms")
+    base_rate = None
+    for workers in range(1, args.max_workers + 1):
+        total, submit, keys = _measure(args, workers)
+        rate = keys / total
+        base_rate = base_rate or rate
+        label = f"{workers} {'threads' if args.threads else 'processes'}"
+        print(f"{label:<12} {rate:>8.0f} keys/s   loop busy {submit * 1000:>8.1f} ms   x{rate / base_rate:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# cold start budget for importing sd_controls.sdsystem and creating an SDSystem, see README.md
+_BUDGET_MS = 150.0
+
+# modules which must not be loaded before a deck is actually used
+_DEFERRED_MODULES = ("hid", "tkinter", "PIL.ImageTk", "PIL.ImageDraw", "PIL.ImageFont")
+
+_STARTUP_SCRIPT = """
+import json, sys, types
+from sd_controls.sdsystem import SDSystem
+from sd_controls.sprites import Sprites
+system = SDSystem()
+loaded = [
+    name for name in {deferred!r}
+    if name in sys.modules and type(sys.modules[name]) is types.ModuleType
+]
+loaded += [name for name, sprite in vars(Sprites).items() if getattr(sprite, "_image", None) is not None]
+print(json.dumps(loaded))
+"""
+
+
+def _run(code: str) -> tuple[float, str]:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stdout
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measures the cold start time of sd_controls")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=_BUDGET_MS, help="allowed startup time in milliseconds")
+    args = parser.parse_args()
+
+    script = _STARTUP_SCRIPT.format(deferred=_DEFERRED_MODULES)
+    interpreter = statistics.median(_run("pass")[0] for _ in range(args.rounds))
+    runs = [_run(script) for _ in range(args.rounds)]
+    startup_ms = (statistics.median(duration for duration, _ in runs) - interpreter) * 1000
+    loaded = json.loads(runs[-1][1].splitlines()[-1])
+
+    print(f"interpreter startup      {interpreter * 1000:>8.1f} ms")
+    print(f"sd_controls startup      {startup_ms:>8.1f} ms (budget {args.budget:.0f} ms)")
+    print(f"eagerly loaded           {', '.join(loaded) or 'nothing'}")
+    if startup_ms > args.budget or loaded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
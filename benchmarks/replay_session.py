@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import importlib
+from typing import Callable
+
+from PIL import Image
+
+from sd_controls.fakedevice import FakeHIDDevice
+from sd_controls.metrics import metrics
+from sd_controls.recorder import ImageRecord, InputRecord, read_session, replay_session
+from sd_controls.sdsystem import SDSystem, SDUserApp, Sprites
+from sd_controls.streamdeck import ReadMode, StreamDeckMk2, iter_mask_keys
+
+# time for the apps to finish handling the last input of the log
+_SETTLE_SECONDS = 0.5
+
+
+class _CounterApp(SDUserApp):
+    def __init__(self, index: int) -> None:
+        super().__init__(f"Counter {index}")
+        self._icon = SDUserApp.generate_labeled_img(Sprites.GOAT, f"App {index}")
+        self._count = 0
+
+    def get_icon(self) -> Image.Image:
+        return self._icon
+
+    def keys_changed(self, pressed: int, released: int) -> None:
+        for key in iter_mask_keys(pressed):
+            if key in self.get_usable_keys():
+                self._count += 1
+                self.set_key(key, SDUserApp.generate_labeled_img(Sprites.GOAT, str(self._count)))
+
+
+def _default_setup(system: SDSystem) -> None:
+    for index in range(system.get_key_count() - 1):
+        system.register_app(_CounterApp(index))
+
+
+def _load_setup(name: str) -> Callable[[SDSystem], None]:
+    module, _, function = name.partition(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def _summarize_log(path: str) -> dict[str, float]:
+    inputs = images = size = 0
+    write_time = 0.0
+    for record in read_session(path):
+        if isinstance(record, InputRecord):
+            inputs += 1
+        elif isinstance(record, ImageRecord):
+            images += 1
+            size += record.size
+            write_time += record.duration
+    return {"inputs": inputs, "images": images, "bytes": size, "write_ms": write_time * 1000}
+
+
+async def _replay(args: argparse.Namespace) -> None:
+    device = FakeHIDDevice(write_latency=args.write_latency, keep_writes=False)
+    deck = StreamDeckMk2(device, read_mode=ReadMode.THREAD, read_timeout=100)
+    system = SDSystem(deck=deck)
+    setup = _load_setup(args.setup) if args.setup else _default_setup
+    setup(system)
+
+    metrics.enable()
+    runner = asyncio.create_task(system.run())
+    player = replay_session(args.log, device, args.speed)
+    await asyncio.to_thread(player.join)
+    await asyncio.sleep(_SETTLE_SECONDS)
+    system.close()
+    await runner
+
+    recorded = _summarize_log(args.log)
+    snapshot = metrics.snapshot()
+    print(
+        f"recorded   {recorded['inputs']} inputs, {recorded['images']} images, {recorded['bytes']} bytes,"
+        f" {recorded['write_ms']:.1f} ms writing"
+    )
+    print(f"replayed   {device.write_count} packets, {device.bytes_written} bytes")
+    for name, timer in sorted(snapshot["timers"].items()):
+        average, maximum = timer["avg"] * 1000, timer["max"] * 1000
+        print(f"{name:<20} {timer['count']:>7} calls {average:>9.3f} ms avg {maximum:>9.3f} ms max")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replays a recorded deck session against a fake device")
+    parser.add_argument("log", help="log written by sd_controls.recorder.SessionRecorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 10 replays ten times faster")
+    parser.add_argument("--setup", help="module:function which registers the apps on the system")
+    parser.add_argument("--write-latency", type=float, default=0.0, help="simulated seconds per HID write")
+    asyncio.run(_replay(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
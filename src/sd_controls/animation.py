@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from PIL import Image, ImageSequence
+
+from sd_controls.deviceimage import DeviceImage
+from sd_controls.encoder import EncodeQuality
+from sd_controls.streamdeck import HardwareStreamDeck
+
+if TYPE_CHECKING:
+    from sd_controls.sdsystem import SDSystem
+
+
+class Animation:
+    """
+    A sequence of frames for one key, durations are given in seconds.
+    Frames are encoded with EncodeQuality.FAST by default so more of them fit the deck's bandwidth.
+    """
+
+    def __init__(
+        self,
+        frames: list[Image.Image],
+        durations: list[float] | float = 0.1,
+        loop: bool = True,
+        quality: EncodeQuality = EncodeQuality.FAST,
+    ) -> None:
+        if len(frames) == 0:
+            raise ValueError("An animation needs at least one frame")
+        self._frames = frames
+        self._durations = durations if isinstance(durations, list) else [durations] * len(frames)
+        if len(self._durations) != len(frames):
+            raise ValueError("Every frame needs a duration")
+        self._loop = loop
+        self._quality = quality
+        self._total_duration = sum(self._durations)
+        self._prepared: dict[tuple, list[DeviceImage]] = {}
+
+    @staticmethod
+    def from_gif(
+        gif: str | Path | Image.Image, loop: bool = True, quality: EncodeQuality = EncodeQuality.FAST
+    ) -> "Animation":
+        image = gif if isinstance(gif, Image.Image) else Image.open(gif)
+        frames = []
+        durations = []
+        for frame in ImageSequence.Iterator(image):
+            frames.append(frame.convert("RGB"))
+            durations.append(frame.info.get("duration", 100) / 1000)
+        return Animation(frames, durations, loop, quality)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def frame_index(self, elapsed: float) -> int | None:
+        """
+        The frame that is due after elapsed seconds, None once a non looping animation has ended
+        """
+        if self._total_duration <= 0:
+            return 0
+        if self._loop:
+            elapsed %= self._total_duration
+        elif elapsed >= self._total_duration:
+            return None
+        for index, duration in enumerate(self._durations):
+            elapsed -= duration
+            if elapsed < 0:
+                return index
+        return len(self._frames) - 1
+
+    def prepare(self, system: "SDSystem") -> list[DeviceImage]:
+        # frames are encoded once per deck model and orientation, models of the same icon size may differ in format
+        deck = system.get_deck()
+        if isinstance(deck, HardwareStreamDeck):
+            model = (deck.get_profile().vendor_id, deck.get_profile().product_id)
+        else:
+            model = type(deck)
+        prepared_key = (model, deck.get_icon_size(), system.get_rotation())
+        if prepared_key not in self._prepared:
+            self._prepared[prepared_key] = [
+                system.prepare_image(frame, encode=True, quality=self._quality) for frame in self._frames
+            ]
+        return self._prepared[prepared_key]
+
+
+class _Playback:
+    def __init__(self, animation: Animation, frames: list[DeviceImage], costs: list[int], started: float) -> None:
+        self.animation = animation
+        self.frames = frames
+        # HID reports each frame takes
+        self.costs = costs
+        self.started = started
+        self.updated = started
+        self.shown: int | None = None
+
+
+class AnimationScheduler:
+    """
+    Plays the animations of one deck from a single task on the event loop.
+    max_fps caps how often keys are updated, max_reports_per_second caps the HID reports sent to the deck.
+    A frame that does not fit the budget is dropped, the key catches up with the next due frame instead.
+    A frame larger than the whole budget is still sent once the budget is full, and the deficit delays later frames.
+    """
+
+    def __init__(self, system: "SDSystem", max_fps: float = 30, max_reports_per_second: int = 500) -> None:
+        self._system = system
+        self._interval = 1 / max_fps
+        self._max_reports_per_second = max_reports_per_second
+        self._playbacks: dict[int, _Playback] = {}
+        self._task: asyncio.Task | None = None
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    def play(self, key: int, animation: Animation) -> None:
+        loop = asyncio.get_running_loop()
+        frames = animation.prepare(self._system)
+        costs = [self._report_count(frame) for frame in frames]
+        self._playbacks[key] = _Playback(animation, frames, costs, loop.time())
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def stop(self, key: int | None = None) -> None:
+        if key is None:
+            self._playbacks.clear()
+        else:
+            self._playbacks.pop(key, None)
+        if not self._playbacks and self._task:
+            self._task.cancel()
+            self._task = None
+
+    def is_playing(self, key: int) -> bool:
+        return key in self._playbacks
+
+    def _report_count(self, frame: DeviceImage) -> int:
+        # decks without HID reports are not limited by USB bandwidth
+        deck = self._system.get_deck()
+        if frame.encoded is None or not isinstance(deck, HardwareStreamDeck):
+            return 0
+        return deck.get_encoder().packet_count(len(frame.encoded))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        capacity = self._max_reports_per_second
+        budget = float(capacity) * self._interval
+        last_tick = loop.time()
+        while self._playbacks:
+            now = loop.time()
+            # the budget refills continuously but never saves up more than one second of traffic
+            budget = min(capacity, budget + (now - last_tick) * capacity)
+            last_tick = now
+
+            updates = {}
+            # keys which have waited longest for an update go first
+            for key, playback in sorted(self._playbacks.items(), key=lambda item: item[1].updated):
+                index = playback.animation.frame_index(now - playback.started)
+                if index is None:
+                    self._playbacks.pop(key)
+                    continue
+                if index == playback.shown:
+                    continue
+                frame = playback.frames[index]
+                cost = playback.costs[index]
+                if budget < min(cost, capacity):
+                    self.frames_dropped += 1
+                    continue
+                budget -= cost
+                playback.shown = index
+                playback.updated = now
+                updates[key] = frame
+
+            if updates:
+                # lets pending key events run before the deck is busy with images
+                await asyncio.sleep(0)
+                try:
+                    self._system.set_keys(updates)
+                    self.frames_sent += len(updates)
+                except Exception as e:
+                    logging.error(f"Error while sending animation frames: {e}")
+            await asyncio.sleep(self._interval)
+        self._task = None
@@ -0,0 +1,122 @@
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+
+class Backpressure(Enum):
+    # a press is ignored while the same callback of the key is running or waiting
+    DROP = 1
+    # a press while the callback is running queues exactly one more run
+    COALESCE = 2
+
+
+class _KeyQueue:
+    def __init__(self) -> None:
+        self.running: Callable | None = None
+        self.pending: list[Callable] = []
+
+
+class CallbackExecutor:
+    """
+    Runs blocking key callbacks on a bounded thread pool, so they can't stall key reading or display updates.
+    Callbacks of the same key run one after another in the order of the presses.
+    """
+
+    def __init__(self, max_workers: int = 4, backpressure: Backpressure = Backpressure.COALESCE) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sd-controls-callback")
+        self._backpressure = backpressure
+        self._queues: dict[tuple[Hashable, int], _KeyQueue] = defaultdict(_KeyQueue)
+        self._lock = Lock()
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+
+    def submit(self, owner: Hashable, key: int, callback: Callable[[], Any]) -> bool:
+        """
+        Schedules a callback of owner for key, returns False if it was dropped or merged with a waiting run
+        """
+        with self._lock:
+            queue = self._queues[(owner, key)]
+            if queue.running is None:
+                try:
+                    self._pool.submit(self._run, (owner, key), callback)
+                except RuntimeError:
+                    # the executor was shut down, e.g. by a press while the system closes
+                    del self._queues[(owner, key)]
+                    self.dropped += 1
+                    return False
+                queue.running = callback
+                return True
+            if self._backpressure == Backpressure.DROP and (callback is queue.running or callback in queue.pending):
+                self.dropped += 1
+                return False
+            if callback in queue.pending:
+                self.coalesced += 1
+                return False
+            queue.pending.append(callback)
+            return True
+
+    def cancel(self, owner: Hashable) -> None:
+        """
+        Drops all waiting callbacks of owner, running ones finish normally
+        """
+        with self._lock:
+            for (queue_owner, _), queue in self._queues.items():
+                if queue_owner == owner:
+                    self.dropped += len(queue.pending)
+                    queue.pending.clear()
+
+    def _run(self, queue_key: tuple[Hashable, int], callback: Callable[[], Any]) -> None:
+        while callback is not None:
+            start = time.perf_counter()
+            try:
+                callback()
+                failed = False
+            except Exception as e:
+                logging.error(f"Error in threaded callback for key {queue_key[1]}: {e}")
+                failed = True
+            duration = time.perf_counter() - start
+
+            with self._lock:
+                self.completed += 1
+                self.failed += failed
+                self.total_duration += duration
+                self.max_duration = max(self.max_duration, duration)
+                queue = self._queues[queue_key]
+                # the next press of this key continues on the same worker to keep the order
+                callback = queue.pending.pop(0) if queue.pending else None
+                queue.running = callback
+                if callback is None:
+                    del self._queues[queue_key]
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(len(queue.pending) + (queue.running is not None) for queue in self._queues.values())
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            in_flight = sum(queue.running is not None for queue in self._queues.values())
+            waiting = sum(len(queue.pending) for queue in self._queues.values())
+            return {
+                "in_flight": in_flight,
+                "queue_depth": in_flight + waiting,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "avg_duration": self.total_duration / self.completed if self.completed else 0.0,
+                "max_duration": self.max_duration,
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            for queue in self._queues.values():
+                queue.pending.clear()
+        self._pool.shutdown(wait=wait)
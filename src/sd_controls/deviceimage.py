@@ -0,0 +1,26 @@
+from PIL import Image
+
+
+class DeviceImage:
+    """
+    An image which is already resized and rotated for a deck, so it can be sent without further PIL work.
+    Create them with SDSystem.prepare_image once and reuse them for every set_key call.
+    """
+
+    def __init__(
+        self, image: Image.Image, rotation: int, digest: bytes, frame_digest: bytes, encoded: bytes | None = None
+    ) -> None:
+        # the resized and rotated image as it is sent to the deck
+        self.image = image
+        # the rotation that was applied to the source image
+        self.rotation = rotation
+        # content hash of the source image, independent of the orientation
+        self.digest = digest
+        # content hash of the prepared image
+        self.frame_digest = frame_digest
+        # the image in the deck's wire format, if it was encoded up front
+        self.encoded = encoded
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.image.size
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Callable
+
+from sd_controls.hiderrors import hid_exception
+from sd_controls.sdsystem import Orientation, SDSystem
+from sd_controls.streamdeck import ReadMode
+from sd_controls.supervisor import SDSupervisor
+
+if TYPE_CHECKING:
+    from sd_controls.renderpool import RenderPool
+
+
+class DeviceManager(SDSupervisor):
+    """
+    Supervisor which watches for Stream Decks being plugged in or removed.
+    A deck that comes back is reattached to its previous SDSystem, which replays the current key images.
+    """
+
+    def __init__(
+        self,
+        setup: Callable[[SDSystem], None] | None = None,
+        orientation: Orientation = Orientation.DEFAULT,
+        timeout: int = 0,
+        poll_interval: float = 1.0,
+        render_pool: "RenderPool | None" = None,
+    ) -> None:
+        super().__init__(setup, orientation, timeout, render_pool)
+        self._poll_interval = poll_interval
+        self._systems_by_device: dict[str, SDSystem] = {}
+        self._present: set[str] = set()
+        self._tasks: list[asyncio.Task] = []
+        self._watching = False
+
+    @staticmethod
+    def _device_id(device: dict) -> str:
+        # the serial number survives re-plugging, the path does not necessarily
+        return device.get("serial_number") or device["path"].decode(errors="replace")
+
+    async def run(self) -> None:
+        self._watching = True
+        loop = asyncio.get_running_loop()
+        try:
+            while self._watching:
+                try:
+                    devices = await loop.run_in_executor(None, SDSystem.enumerate_streamdecks)
+                except hid_exception() as e:
+                    # enumeration fails now and then while devices are plugged in, the next poll retries
+                    logging.error(f"Could not enumerate Stream Decks: {e}")
+                else:
+                    self._update_devices(devices)
+                await asyncio.sleep(self._poll_interval)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+
+    def _update_devices(self, devices: list[dict]) -> None:
+        present = set()
+        for device in devices:
+            device_id = self._device_id(device)
+            present.add(device_id)
+            system = self._systems_by_device.get(device_id)
+            if system is not None and system.get_deck().is_connected():
+                continue
+            try:
+                deck = SDSystem.open_streamdeck(device, read_mode=ReadMode.THREAD, write_thread=True)
+            except hid_exception() as e:
+                logging.error(f"Could not open Stream Deck {device_id}: {e}")
+                continue
+
+            if system is None:
+                system = self.add_deck(deck)
+                system.wait_for_reattach()
+                self._systems_by_device[device_id] = system
+                task = asyncio.create_task(system.run(), name=f"Stream Deck {device_id}")
+                task.add_done_callback(lambda done, device_id=device_id: self._reap_system(device_id, done))
+                self._tasks.append(task)
+            else:
+                system.attach_deck(deck)
+
+        for device_id in self._present - present:
+            print("Stream Deck removed", device_id)
+        self._present = present
+
+    def _reap_system(self, device_id: str, task: asyncio.Task) -> None:
+        """
+        Drops the system of a deck whose run() failed, the deck is opened with a new system on the next poll
+        """
+        if task in self._tasks:
+            self._tasks.remove(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        logging.error(f"Stream Deck {device_id} stopped with an error: {task.exception()}")
+        system = self._systems_by_device.pop(device_id, None)
+        if system is None:
+            return
+        if system in self._systems:
+            self._systems.remove(system)
+        self._present.discard(device_id)
+        try:
+            system.close()
+        except Exception as e:
+            logging.error(f"Error while closing Stream Deck {device_id}: {e}")
+
+    def close(self) -> None:
+        self._watching = False
+        for task in self._tasks:
+            task.cancel()
+        super().close()
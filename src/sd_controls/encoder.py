@@ -0,0 +1,132 @@
+import io
+from enum import Enum
+
+from PIL import Image
+
+
+class EncodeQuality(Enum):
+    # best image quality, for static icons
+    FULL = 1
+    # a compromise for keys that change now and then
+    BALANCED = 2
+    # fewest packets, for keys which change many times per second
+    FAST = 3
+
+
+# JPEG settings (quality, chroma subsampling, optimize) which are tried in order until the image fits.
+# FULL starts just above Pillow's defaults (75, 4:2:0), higher settings rarely fit and cost several encodes.
+# Each ladder starts below the one before, so an image that fits right away never looks better at a lower quality.
+_QUALITY_LADDERS: dict[EncodeQuality, tuple[tuple[int, int, bool], ...]] = {
+    EncodeQuality.FULL: ((80, 2, True), (75, 2, True)),
+    EncodeQuality.BALANCED: ((75, 2, True), (60, 2, True), (45, 2, True)),
+    EncodeQuality.FAST: ((70, 2, True), (55, 2, True), (40, 2, True), (25, 2, True)),
+}
+
+# packets an image may span per quality, tuned for 72x72 icons in 1016 byte payloads
+DEFAULT_TARGET_PACKETS: dict[EncodeQuality, int] = {
+    EncodeQuality.FULL: 2,
+    EncodeQuality.BALANCED: 1,
+    EncodeQuality.FAST: 1,
+}
+
+_MARKER_SOI = 0xD8
+_MARKER_SOS = 0xDA
+_MARKER_COM = 0xFE
+
+
+def strip_jpeg_markers(data: bytes) -> bytes:
+    """
+    Removes application (APPn) and comment segments, which decoders don't need to show the image.
+    Data that is not laid out as expected is returned unchanged.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != _MARKER_SOI:
+        return data
+    kept = [data[:2]]
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return data
+        marker = data[offset + 1]
+        if marker == _MARKER_SOS:
+            # entropy coded data follows, everything from here on is needed
+            kept.append(data[offset:])
+            return b"".join(kept)
+        segment_end = offset + 2 + int.from_bytes(data[offset + 2 : offset + 4], "big")
+        if not (0xE0 <= marker <= 0xEF or marker == _MARKER_COM):
+            kept.append(data[offset:segment_end])
+        offset = segment_end
+    return data
+
+
+class JpegEncoder:
+    """
+    Encodes key images for a deck. For every EncodeQuality the JPEG settings are lowered step by step
+    until the image fits the target number of HID packets, the last step is used if nothing fits.
+    """
+
+    def __init__(
+        self,
+        icon_size: int,
+        payload_length: int,
+        target_packets: dict[EncodeQuality, int] | None = None,
+        strip_markers: bool = True,
+    ) -> None:
+        self._icon_size = icon_size
+        self._payload_length = payload_length
+        self._target_packets = dict(DEFAULT_TARGET_PACKETS)
+        if target_packets:
+            self._target_packets.update(target_packets)
+        self._strip_markers = strip_markers
+
+    def packet_count(self, length: int) -> int:
+        return max(1, -(-length // self._payload_length))
+
+    def get_target_packets(self, quality: EncodeQuality) -> int:
+        return self._target_packets[quality]
+
+    def encode(self, image: Image.Image, quality: EncodeQuality = EncodeQuality.FULL) -> bytes:
+        if self._icon_size and image.size != (self._icon_size, self._icon_size):
+            image = image.resize((self._icon_size, self._icon_size))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        target_packets = self._target_packets[quality]
+        encoded = b""
+        for jpeg_quality, subsampling, optimize in _QUALITY_LADDERS[quality]:
+            encoded = self._save(image, quality=jpeg_quality, subsampling=subsampling, optimize=optimize)
+            if self.packet_count(len(encoded)) <= target_packets:
+                break
+        return encoded
+
+    def _save(self, image: Image.Image, **options) -> bytes:
+        img_byte_buffer = io.BytesIO()
+        image.save(img_byte_buffer, format="JPEG", **options)
+        encoded = img_byte_buffer.getvalue()
+        return strip_jpeg_markers(encoded) if self._strip_markers else encoded
+
+
+class BmpEncoder:
+    """
+    Encodes key images as uncompressed bitmaps for decks which don't decode JPEGs.
+    The size of a bitmap only depends on the icon size, so the quality has no effect.
+    """
+
+    def __init__(self, icon_size: int, payload_length: int) -> None:
+        self._icon_size = icon_size
+        self._payload_length = payload_length
+
+    def packet_count(self, length: int) -> int:
+        return max(1, -(-length // self._payload_length))
+
+    def get_target_packets(self, quality: EncodeQuality) -> int:
+        # a 24 bit bitmap with its 54 byte header
+        return self.packet_count(54 + self._icon_size * self._icon_size * 3)
+
+    def encode(self, image: Image.Image, quality: EncodeQuality = EncodeQuality.FULL) -> bytes:
+        if self._icon_size and image.size != (self._icon_size, self._icon_size):
+            image = image.resize((self._icon_size, self._icon_size))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        img_byte_buffer = io.BytesIO()
+        image.save(img_byte_buffer, format="BMP")
+        return img_byte_buffer.getvalue()
@@ -0,0 +1,131 @@
+import time
+from queue import Empty, Queue
+from threading import Thread
+from typing import Iterable
+
+from sd_controls.hiderrors import hid_exception
+from sd_controls.profiles import DeviceProfile
+
+
+class FakeHIDDevice:
+    """
+    Stand-in for hid.Device that records everything written to it and replays key reports.
+    write_latency and read_latency (seconds) simulate the USB link timing.
+    """
+
+    def __init__(
+        self,
+        product: str = "Fake Stream Deck",
+        manufacturer: str = "sd-controls",
+        serial: str = "FAKE0001",
+        key_count: int = 15,
+        key_data_offset: int = 4,
+        report_length: int = 512,
+        write_latency: float = 0.0,
+        read_latency: float = 0.0,
+        keep_writes: bool = True,
+    ) -> None:
+        self.product = product
+        self.manufacturer = manufacturer
+        self.serial = serial
+        self.writes: list[bytes] = []
+        self.feature_reports: list[bytes] = []
+        self.write_count = 0
+        self.bytes_written = 0
+        self._key_count = key_count
+        self._key_data_offset = key_data_offset
+        self._report_length = report_length
+        self._write_latency = write_latency
+        self._read_latency = read_latency
+        self._keep_writes = keep_writes
+        self._reports: Queue[bytes] = Queue()
+        self._connected = True
+
+    @classmethod
+    def for_profile(cls, profile: DeviceProfile, **options) -> "FakeHIDDevice":
+        """
+        A fake device which reports its keys like the model described by profile
+        """
+        return cls(
+            product=profile.name,
+            key_count=profile.key_count,
+            key_data_offset=profile.key_data_offset,
+            report_length=profile.input_report_length,
+            **options,
+        )
+
+    def push_report(self, data: bytes) -> None:
+        self._reports.put(data)
+
+    def key_report(self, keys: list[bool] | int) -> bytes:
+        if isinstance(keys, int):
+            keys = [bool(keys >> key & 1) for key in range(self._key_count)]
+        report = bytearray(self._report_length)
+        report[0] = 0x01
+        for key, pressed in enumerate(keys[: self._key_count]):
+            report[self._key_data_offset + key] = int(pressed)
+        return bytes(report)
+
+    def push_keys(self, keys: list[bool] | int) -> None:
+        self.push_report(self.key_report(keys))
+
+    def play(self, script: Iterable[tuple[float, list[bool] | int]], speed: float = 1.0) -> Thread:
+        """
+        Pushes key states from a background thread, each entry is (seconds since start, keys)
+        """
+
+        def player() -> None:
+            start = time.perf_counter()
+            for at, keys in script:
+                delay = start + at / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.push_keys(keys)
+
+        thread = Thread(target=player, name="fake-hid-player", daemon=True)
+        thread.start()
+        return thread
+
+    def reset(self) -> None:
+        self.writes.clear()
+        self.feature_reports.clear()
+        self.write_count = 0
+        self.bytes_written = 0
+
+    def disconnect(self) -> None:
+        self._connected = False
+        # wakes up a reader blocked on the report queue
+        self._reports.put(b"")
+
+    def read(self, size: int, timeout: int | None = None) -> bytes:
+        self._check_connected()
+        try:
+            data = self._reports.get(timeout=None if timeout is None or timeout < 0 else timeout / 1000)
+        except Empty:
+            return b""
+        self._check_connected()
+        if self._read_latency:
+            time.sleep(self._read_latency)
+        return data[:size]
+
+    def write(self, data: bytes) -> int:
+        self._check_connected()
+        if self._write_latency:
+            time.sleep(self._write_latency)
+        self.write_count += 1
+        self.bytes_written += len(data)
+        if self._keep_writes:
+            self.writes.append(bytes(data))
+        return len(data)
+
+    def send_feature_report(self, data: bytes) -> int:
+        self._check_connected()
+        self.feature_reports.append(bytes(data))
+        return len(data)
+
+    def close(self) -> None:
+        self._connected = False
+
+    def _check_connected(self) -> None:
+        if not self._connected:
+            raise hid_exception()("device disconnected")
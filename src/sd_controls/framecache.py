@@ -0,0 +1,62 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable
+
+from PIL import Image
+
+
+def image_digest(image: Image.Image) -> bytes:
+    """
+    Content hash of an image, used to identify identical frames independent of the image object
+    """
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode}{image.size}".encode())
+    return digest.digest()
+
+
+class FrameCache:
+    """
+    Bounded LRU cache of fully packetized key images
+    """
+
+    def __init__(self, max_size: int = 256) -> None:
+        self._max_size = max_size
+        self._frames: OrderedDict[Hashable, tuple[bytes, ...]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def get(self, key: Hashable) -> tuple[bytes, ...] | None:
+        with self._lock:
+            packets = self._frames.get(key)
+            if packets is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return packets
+
+    def put(self, key: Hashable, packets: tuple[bytes, ...]) -> None:
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._frames[key] = packets
+            self._frames.move_to_end(key)
+            while len(self._frames) > self._max_size:
+                self._frames.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_max_size(self) -> int:
+        return self._max_size
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._frames), "max_size": self._max_size, "hits": self.hits, "misses": self.misses}
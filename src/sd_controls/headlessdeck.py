@@ -0,0 +1,168 @@
+import asyncio
+from pathlib import Path
+from threading import Lock
+from typing import AsyncIterator
+
+from PIL import Image, ImageChops
+
+from sd_controls.deviceimage import DeviceImage
+from sd_controls.framecache import image_digest
+from sd_controls.sprites import Sprites
+from sd_controls.streamdeck import StreamDeck
+
+
+class HeadlessDeckMk2(StreamDeck):
+    """
+    A deck without hardware or display, for tests and load tests. Key images are kept in a framebuffer
+    which can be snapshotted and compared against golden images, key input is injected with press, release,
+    push_keys or play, from any thread.
+    """
+
+    _ICON_SIZE: int = 72
+    _KEY_COUNT: int = 15
+    _KEY_COLUMNS: int = 5
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._framebuffer: list[Image.Image] = [Sprites.CLEAR] * self._KEY_COUNT
+        self._frame_digests: list[bytes | None] = [None] * self._KEY_COUNT
+        self._input_lock = Lock()
+        self._input_mask = 0
+        # injected masks which were not handed to the key listeners yet
+        self._unprocessed = 0
+        # input that arrives before run() is queued until the event loop is known
+        self._pending_input: list[int] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self.writes = 0
+        self.skipped_writes = 0
+
+    def __str__(self) -> str:
+        return "Headless Stream Deck Mk.2"
+
+    def set_key_image(self, key: int, image: Image.Image | DeviceImage) -> bool:
+        if not 0 <= key < self._KEY_COUNT:
+            return False
+        if isinstance(image, DeviceImage):
+            digest = image.frame_digest
+            image = image.image
+        else:
+            image = image or Sprites.CLEAR
+            digest = image_digest(image)
+        # unchanged keys are not redrawn
+        if digest == self._frame_digests[key]:
+            self.skipped_writes += 1
+            return True
+        self._framebuffer[key] = image
+        self._frame_digests[key] = digest
+        self.writes += 1
+        return True
+
+    def get_key_image(self, key: int) -> Image.Image:
+        return self._framebuffer[key]
+
+    def snapshot(self) -> Image.Image:
+        """
+        Renders the framebuffer into one image laid out like the deck's keys
+        """
+        size = self._ICON_SIZE
+        rows = -(-self._KEY_COUNT // self._KEY_COLUMNS)
+        snapshot = Image.new("RGB", (self._KEY_COLUMNS * size, rows * size))
+        for key, image in enumerate(self._framebuffer):
+            if image.size != (size, size):
+                image = image.resize((size, size))
+            snapshot.paste(image.convert("RGB"), (key % self._KEY_COLUMNS * size, key // self._KEY_COLUMNS * size))
+        return snapshot
+
+    def save_snapshot(self, path: str | Path) -> None:
+        self.snapshot().save(path)
+
+    def compare(self, golden: Image.Image | str | Path, tolerance: int = 0) -> bool:
+        """
+        True if the current snapshot matches a golden image, no channel of any pixel may differ by more than tolerance
+        """
+        if not isinstance(golden, Image.Image):
+            golden = Image.open(golden)
+        snapshot = self.snapshot()
+        if golden.size != snapshot.size:
+            return False
+        difference = ImageChops.difference(snapshot, golden.convert("RGB"))
+        return max(high for _, high in difference.getextrema()) <= tolerance
+
+    def push_keys(self, mask: int) -> None:
+        """
+        Sets the state of all keys as a bit mask, like a report read from a real deck
+        """
+        with self._input_lock:
+            self._input_mask = mask
+            self._unprocessed += 1
+            if self._queue is None:
+                self._pending_input.append(mask)
+                return
+            loop, queue = self._loop, self._queue
+        loop.call_soon_threadsafe(queue.put_nowait, mask)
+
+    def press(self, key: int) -> None:
+        self.push_keys(self._input_mask | 1 << key)
+
+    def release(self, key: int) -> None:
+        self.push_keys(self._input_mask & ~(1 << key))
+
+    def tap(self, key: int) -> None:
+        self.press(key)
+        self.release(key)
+
+    async def play(self, script: list[tuple[float, int]], speed: float = 1.0) -> None:
+        """
+        Pushes key masks from the event loop, each entry is (seconds since start, mask)
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for at, mask in script:
+            delay = start + at / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.push_keys(mask)
+
+    async def drain(self) -> None:
+        """
+        Waits until all injected input has been handed to the key listeners
+        """
+        while self._unprocessed and self._running:
+            await asyncio.sleep(0)
+
+    async def _reports(self) -> AsyncIterator[int]:
+        with self._input_lock:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            for mask in self._pending_input:
+                self._queue.put_nowait(mask)
+            self._pending_input.clear()
+        try:
+            while self._running:
+                mask = await self._queue.get()
+                if mask is None:
+                    break
+                yield mask
+                with self._input_lock:
+                    self._unprocessed -= 1
+        finally:
+            with self._input_lock:
+                self._loop = None
+                self._queue = None
+
+    def stop(self) -> None:
+        super().stop()
+        with self._input_lock:
+            if self._queue is None:
+                return
+            loop, queue = self._loop, self._queue
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        except RuntimeError:
+            # the event loop is already closed
+            pass
+
+    def _get_data(self) -> int | None:
+        # input is delivered through _reports
+        return None
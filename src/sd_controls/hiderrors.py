@@ -0,0 +1,24 @@
+from sd_controls.lazyimport import lazy_import
+
+
+class HIDUnavailableError(Exception):
+    """
+    Raised in place of hid.HIDException where hidapi can't be loaded, e.g. by a FakeHIDDevice in CI
+    """
+
+
+_hid_exception: type[Exception] | None = None
+
+
+def hid_exception() -> type[Exception]:
+    """
+    hid.HIDException, or HIDUnavailableError if hid can't be loaded. Resolving it never raises, so except clauses
+    only load hid once an exception reaches them and decks which don't need hid keep their own errors.
+    """
+    global _hid_exception
+    if _hid_exception is None:
+        try:
+            _hid_exception = lazy_import("hid").HIDException
+        except (ImportError, AttributeError, OSError):
+            _hid_exception = HIDUnavailableError
+    return _hid_exception
@@ -0,0 +1,131 @@
+from threading import Lock
+from typing import TYPE_CHECKING
+
+from PIL import Image
+
+from sd_controls.lazyimport import lazy_import
+
+if TYPE_CHECKING:
+    from PIL.ImageFont import FreeTypeFont
+
+ImageDraw = lazy_import("PIL.ImageDraw")
+ImageFont = lazy_import("PIL.ImageFont")
+
+_atlases: dict["FreeTypeFont", "GlyphAtlas"] = {}
+_atlases_lock = Lock()
+
+
+class GlyphAtlas:
+    """
+    Rasterized glyphs of one font (and so one size). Text masks are composed from the cached glyph tiles
+    instead of running FreeType for every label. The composition reproduces Pillow's basic text layout
+    and its blending of overlapping glyphs, so the masks are identical to ImageFont.getmask2.
+    """
+
+    def __init__(self, font: "FreeTypeFont") -> None:
+        self._font = font
+        # character -> (glyph coverage in the alpha band or None for blank glyphs, offset from the pen, advance)
+        self._glyphs: dict[str, tuple[Image.Image | None, tuple[int, int], int]] = {}
+        self._kerning: dict[tuple[str, str], int] = {}
+        # hinted layouts have whole pixel advances, anything else is left to Pillow
+        self.supported = font.layout_engine == ImageFont.Layout.BASIC and float(font.getlength("x")).is_integer()
+        # distance from the baseline to the middle anchor, only depends on the font's metrics
+        _, (_, baseline_top) = font.getmask2("x", anchor="ls")
+        _, (_, middle_top) = font.getmask2("x", anchor="mm")
+        self._middle_offset = middle_top - baseline_top
+
+    def _glyph(self, char: str) -> tuple[Image.Image | None, tuple[int, int], int]:
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            advance = self._font.getlength(char)
+            if not advance.is_integer():
+                self.supported = False
+            mask, offset = self._font.getmask2(char, mode="L", anchor="ls")
+            tile = None
+            if mask.size[0] and mask.size[1]:
+                tile = Image.new("RGBA", mask.size)
+                tile.putalpha(Image.frombytes("L", mask.size, bytes(mask)))
+            glyph = self._glyphs[char] = (tile, offset, int(advance))
+        return glyph
+
+    def _kern(self, left: str, right: str) -> int:
+        kerning = self._kerning.get((left, right))
+        if kerning is None:
+            pair_length = self._font.getlength(left + right)
+            if not pair_length.is_integer():
+                self.supported = False
+            kerning = self._kerning[(left, right)] = int(pair_length) - self._glyph(left)[2] - self._glyph(right)[2]
+        return kerning
+
+    def text_mask(self, text: str) -> tuple[Image.Image, tuple[int, int]] | None:
+        """
+        The coverage mask of a single line of text and its offset from the "mm" anchor point,
+        None if the text can't be composed from the atlas
+        """
+        if not self.supported or not text or "\n" in text:
+            return None
+        tiles = []
+        pen = 0
+        previous = None
+        for char in text:
+            if previous is not None:
+                pen += self._kern(previous, char)
+            tile, (x_offset, y_offset), advance = self._glyph(char)
+            if tile is not None:
+                tiles.append((tile, pen + x_offset, y_offset))
+            pen += advance
+            previous = char
+        if not tiles or not self.supported:
+            return None
+
+        # horizontally the mask spans the advance width as well as the ink, like Pillow's text bounding box
+        left = min(0, min(x for _, x, _ in tiles))
+        top = min(y for _, _, y in tiles)
+        right = max(pen, max(x + tile.size[0] for tile, x, _ in tiles))
+        bottom = max(y + tile.size[1] for tile, _, y in tiles)
+        # overlapping glyph edges are blended like FreeType coverage in Pillow's text renderer
+        composed = Image.new("RGBA", (right - left, bottom - top))
+        for tile, x, y in tiles:
+            composed.alpha_composite(tile, (x - left, y - top))
+        # the horizontal middle of the advance width, rounded like FreeType's 26.6 fixed point values
+        middle = (pen * 64 // 2 + 32) >> 6
+        return composed.getchannel("A"), (left - middle, top + self._middle_offset)
+
+
+def glyph_atlas(font: "FreeTypeFont") -> GlyphAtlas:
+    with _atlases_lock:
+        atlas = _atlases.get(font)
+        if atlas is None:
+            atlas = _atlases[font] = GlyphAtlas(font)
+        return atlas
+
+
+def draw_label(
+    image: Image.Image,
+    label: str,
+    position: tuple[int, int],
+    color: tuple[int, int, int],
+    font: "FreeTypeFont",
+    background: str | None,
+) -> None:
+    """
+    Draws a label centered on position into image, with an optional background box behind the text.
+    The result matches ImageDraw.textbbox, rectangle and text with anchor "mm" pixel for pixel.
+    """
+    draw = ImageDraw.Draw(image)
+    rendered = None
+    if all(float(coordinate).is_integer() for coordinate in position):
+        rendered = glyph_atlas(font).text_mask(label)
+    if rendered is None:
+        if background is not None:
+            bbox = draw.textbbox(position, label, font=font, anchor="mm", align="center")
+            draw.rectangle(bbox, fill=background)
+        draw.text(position, label, color, font=font, anchor="mm", align="center")
+        return
+
+    mask, (x_offset, y_offset) = rendered
+    x, y = int(position[0]) + x_offset, int(position[1]) + y_offset
+    if background is not None:
+        draw.rectangle((x, y, x + mask.size[0], y + mask.size[1]), fill=background)
+    # blends the mask like ImageDraw.text blends FreeType's glyph mask
+    draw.bitmap((x, y), mask, fill=color)
@@ -0,0 +1,45 @@
+import importlib.abc
+import importlib.util
+import sys
+from types import ModuleType
+
+
+class _ForgetFailedLoader(importlib.abc.Loader):
+    """
+    Removes a module from sys.modules when executing it fails, so a later import raises the error again
+    instead of returning the half initialised module
+    """
+
+    def __init__(self, loader: importlib.abc.Loader, name: str) -> None:
+        self._loader = loader
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: ModuleType) -> None:
+        try:
+            self._loader.exec_module(module)
+        except BaseException:
+            if sys.modules.get(self._name) is module:
+                del sys.modules[self._name]
+            raise
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns a module which is only executed on its first attribute access, so importing sd_controls
+    does not pay for hid, tkinter or optional Pillow plugins that a process never uses.
+    A module that can't be found raises ImportError right away.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(_ForgetFailedLoader(spec.loader, name))
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
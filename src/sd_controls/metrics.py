@@ -0,0 +1,119 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from threading import Lock
+
+
+class _Timer:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class Metrics:
+    """
+    In-process counters and timers of the hot paths. Disabled by default, instrumented code checks
+    enabled before taking any timestamps so the overhead is a single attribute lookup.
+    """
+
+    def __init__(self, prefix: str = "sd_controls") -> None:
+        self.enabled = False
+        self._prefix = prefix
+        self._counters: dict[str, float] = {}
+        self._timers: dict[str, _Timer] = {}
+        self._lock = Lock()
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = _Timer()
+            timer.observe(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timers": {
+                    name: {
+                        "count": timer.count,
+                        "sum": timer.total,
+                        "max": timer.max,
+                        "avg": timer.total / timer.count if timer.count else 0.0,
+                    }
+                    for name, timer in self._timers.items()
+                },
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{self._prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, timer in sorted(snapshot["timers"].items()):
+            metric = f"{self._prefix}_{name}_seconds"
+            lines += [
+                f"# TYPE {metric} summary",
+                f"{metric}_count {timer['count']}",
+                f"{metric}_sum {timer['sum']}",
+                f"# TYPE {metric}_max gauge",
+                f"{metric}_max {timer['max']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def render(self, format: str = "prometheus") -> str:
+        return self.to_json() if format == "json" else self.to_prometheus()
+
+    def dump(self, path: str | Path, format: str = "prometheus") -> None:
+        """
+        Writes the metrics to a file, the file is replaced atomically so scrapers never see partial data
+        """
+        path = Path(path)
+        temp_path = path.with_name(path.name + ".tmp")
+        temp_path.write_text(self.render(format))
+        os.replace(temp_path, path)
+
+    async def dump_periodically(self, path: str | Path, interval: float = 10.0, format: str = "prometheus") -> None:
+        while True:
+            self.dump(path, format)
+            await asyncio.sleep(interval)
+
+    async def serve(self, path: str | Path, format: str = "prometheus") -> asyncio.AbstractServer:
+        """
+        Serves the metrics on a unix domain socket, every connection receives one dump
+        """
+
+        async def handle(_: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            writer.write(self.render(format).encode())
+            await writer.drain()
+            writer.close()
+
+        return await asyncio.start_unix_server(handle, path=str(path))
+
+
+# the registry used by all of sd_controls
+metrics = Metrics()
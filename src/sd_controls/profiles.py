@@ -0,0 +1,250 @@
+import struct
+from enum import Enum
+from functools import lru_cache
+from operator import itemgetter
+
+from PIL import Image
+
+from sd_controls.encoder import BmpEncoder, EncodeQuality, JpegEncoder
+
+ELGATO_VENDOR_ID = 0x0FD9
+
+
+@lru_cache
+def _zero_payload(length: int) -> memoryview:
+    # padding of the last report of an image, shared by all images of a payload length
+    return memoryview(bytes(length))
+
+
+class ImageFormat(Enum):
+    JPEG = 1
+    BMP = 2
+
+
+class HeaderField(Enum):
+    # the variable fields of an image report header
+    KEY = 1
+    IS_LAST = 2
+    PAYLOAD_LENGTH = 3
+    PACKET_INDEX = 4
+
+
+class ImageHeader:
+    """
+    Layout of the header in front of every image report: a struct format and one value per struct field,
+    either a constant or a HeaderField. The constants are arranged once, packing a header only fills in
+    the variable fields.
+    """
+
+    def __init__(self, format: str, fields: tuple[int | HeaderField, ...], key_base: int = 0) -> None:
+        self._struct = struct.Struct(format)
+        if len(fields) < 2 or len(fields) != len(self._struct.unpack(bytes(self._struct.size))):
+            raise ValueError(f"The header format {format!r} does not match {len(fields)} fields")
+        self.length = self._struct.size
+        # some decks number their keys from 1 in image reports
+        self._key_base = key_base
+        variables = tuple(HeaderField)
+        constants = tuple(field for field in fields if not isinstance(field, HeaderField))
+        # the values are picked from (key, is_last, payload_length, packet_index, *constants)
+        indices = []
+        constant_index = len(variables)
+        for field in fields:
+            if isinstance(field, HeaderField):
+                indices.append(variables.index(field))
+            else:
+                indices.append(constant_index)
+                constant_index += 1
+        self._constants = constants
+        self._arrange = itemgetter(*indices)
+        # struct field of each variable field the header has
+        self._variable_fields = {field: position for position, field in enumerate(fields) if field in variables}
+        self._arguments = (format, tuple(fields), key_base)
+
+    def __reduce__(self) -> tuple:
+        # compiled structs can't be pickled, render workers rebuild the header from its definition
+        return ImageHeader, self._arguments
+
+    def pack(self, key: int, is_last: bool, payload_length: int, packet_index: int) -> bytes:
+        values = (key + self._key_base, is_last, payload_length, packet_index) + self._constants
+        return self._struct.pack(*self._arrange(values))
+
+    def unpack_from(self, report: bytes) -> dict[HeaderField, int]:
+        """
+        The variable fields of a report's header, the key counted from 0. Raises ValueError if it is too short.
+        """
+        try:
+            values = self._struct.unpack_from(report)
+        except struct.error as e:
+            raise ValueError(f"Report of {len(report)} bytes has no image header: {e}") from None
+        fields = {field: values[position] for field, position in self._variable_fields.items()}
+        if HeaderField.KEY in fields:
+            fields[HeaderField.KEY] -= self._key_base
+        return fields
+
+    def pack_into(
+        self, buffer: bytearray, offset: int, key: int, is_last: bool, payload_length: int, packet_index: int
+    ) -> None:
+        values = (key + self._key_base, is_last, payload_length, packet_index) + self._constants
+        self._struct.pack_into(buffer, offset, *self._arrange(values))
+
+
+class DeviceProfile:
+    """
+    Everything sd_controls needs to know to drive a Stream Deck model with HardwareStreamDeck
+    """
+
+    def __init__(
+        self,
+        name: str,
+        product_id: int,
+        key_columns: int,
+        key_rows: int,
+        icon_size: int,
+        image_format: ImageFormat,
+        image_header: ImageHeader,
+        image_rotation: int = 0,
+        image_transpose: Image.Transpose | None = None,
+        image_report_length: int = 1024,
+        input_report_length: int = 512,
+        key_data_offset: int = 4,
+        brightness_command: bytes = b"\x03\x08",
+        brightness_report_length: int = 32,
+        timeout_command: bytes | None = b"\x03\x0d",
+        vendor_id: int = ELGATO_VENDOR_ID,
+    ) -> None:
+        self.name = name
+        self.vendor_id = vendor_id
+        self.product_id = product_id
+        self.key_columns = key_columns
+        self.key_rows = key_rows
+        self.key_count = key_columns * key_rows
+        self.icon_size = icon_size
+        self.image_format = image_format
+        self.image_header = image_header
+        # rotation in degrees (as passed to Image.rotate) for an image to appear upright on the device
+        self.image_rotation = image_rotation
+        # applied right before encoding, for decks whose image orientation is not a rotation
+        self.image_transpose = image_transpose
+        self.image_report_length = image_report_length
+        self.image_payload_length = image_report_length - image_header.length
+        self.input_report_length = input_report_length
+        # position of the first key's state in an input report
+        self.key_data_offset = key_data_offset
+        # feature report prefixes, followed by the percentage or the timeout in seconds as little endian short
+        self.brightness_command = brightness_command
+        self.brightness_report_length = brightness_report_length
+        # None for decks without a standby timeout
+        self.timeout_command = timeout_command
+
+    def __str__(self) -> str:
+        return self.name
+
+    def create_encoder(self, target_packets: dict[EncodeQuality, int] | None = None) -> JpegEncoder | BmpEncoder:
+        if self.image_format == ImageFormat.BMP:
+            return BmpEncoder(self.icon_size, self.image_payload_length)
+        return JpegEncoder(self.icon_size, self.image_payload_length, target_packets)
+
+    def build_image_reports(self, key: int, encoded: bytes) -> tuple[bytes, ...]:
+        """
+        Splits an encoded image into the HID reports for key, the last report is padded with zeros
+        """
+        pack_header = self.image_header.pack
+        max_payload_length = self.image_payload_length
+        # slices of the view refer to the encoded image, each report is a single concatenation
+        payload = memoryview(encoded)
+        report_count = -(-len(payload) // max_payload_length)
+        reports = []
+        for index in range(report_count):
+            chunk = payload[index * max_payload_length : (index + 1) * max_payload_length]
+            header = pack_header(key, index == report_count - 1, len(chunk), index)
+            if len(chunk) == max_payload_length:
+                reports.append(header + chunk)
+            else:
+                padding = _zero_payload(max_payload_length)[: max_payload_length - len(chunk)]
+                reports.append(b"".join((header, chunk, padding)))
+        return tuple(reports)
+
+    def brightness_report(self, percentage: int) -> bytes:
+        return (self.brightness_command + bytes([percentage])).ljust(self.brightness_report_length, b"\0")
+
+    def timeout_report(self, timeout_secs: int) -> bytes | None:
+        if self.timeout_command is None:
+            return None
+        return self.timeout_command + timeout_secs.to_bytes(2, "little")
+
+
+# 0x02 0x07, key, last package flag, payload length and package index as little endian shorts
+_JPEG_IMAGE_HEADER = ImageHeader(
+    "<BBBBHH",
+    (0x02, 0x07, HeaderField.KEY, HeaderField.IS_LAST, HeaderField.PAYLOAD_LENGTH, HeaderField.PACKET_INDEX),
+)
+# 0x02 0x01, package index as little endian short, last package flag, key counted from 1 and padding
+_BMP_IMAGE_HEADER = ImageHeader(
+    "<BBHBB10x",
+    (0x02, 0x01, HeaderField.PACKET_INDEX, HeaderField.IS_LAST, HeaderField.KEY),
+    key_base=1,
+)
+
+
+def _jpeg_profile(name: str, product_id: int, key_columns: int, key_rows: int, icon_size: int) -> DeviceProfile:
+    # the JPEG models share their report layout
+    return DeviceProfile(
+        name, product_id, key_columns, key_rows, icon_size, ImageFormat.JPEG, _JPEG_IMAGE_HEADER, image_rotation=180
+    )
+
+
+def _mini_profile(name: str, product_id: int) -> DeviceProfile:
+    return DeviceProfile(
+        name,
+        product_id,
+        3,
+        2,
+        80,
+        ImageFormat.BMP,
+        _BMP_IMAGE_HEADER,
+        image_transpose=Image.Transpose.TRANSPOSE,
+        input_report_length=32,
+        key_data_offset=1,
+        brightness_command=b"\x05\x55\xaa\xd1\x01",
+        brightness_report_length=17,
+        timeout_command=None,
+    )
+
+
+STREAMDECK_MK2 = _jpeg_profile("Stream Deck Mk.2", 0x0080, 5, 3, 72)
+STREAMDECK_MK2_SCISSOR = _jpeg_profile("Stream Deck Mk.2 (scissor keys)", 0x00A5, 5, 3, 72)
+STREAMDECK_ORIGINAL_V2 = _jpeg_profile("Stream Deck Original V2", 0x006D, 5, 3, 72)
+STREAMDECK_XL = _jpeg_profile("Stream Deck XL", 0x006C, 8, 4, 96)
+STREAMDECK_XL_V2 = _jpeg_profile("Stream Deck XL V2", 0x008F, 8, 4, 96)
+STREAMDECK_MINI = _mini_profile("Stream Deck Mini", 0x0063)
+STREAMDECK_MINI_MK2 = _mini_profile("Stream Deck Mini Mk.2", 0x0090)
+
+# supported models by vendor and product id
+DEVICE_PROFILES: dict[tuple[int, int], DeviceProfile] = {}
+
+
+def register_profile(profile: DeviceProfile) -> None:
+    """
+    Adds a model to the devices which are enumerated and opened, replacing a profile with the same ids
+    """
+    DEVICE_PROFILES[(profile.vendor_id, profile.product_id)] = profile
+
+
+def get_profile(vendor_id: int, product_id: int) -> DeviceProfile | None:
+    return DEVICE_PROFILES.get((vendor_id, product_id))
+
+
+def get_vendor_ids() -> set[int]:
+    return {vendor_id for vendor_id, _ in DEVICE_PROFILES}
+
+
+for _profile in (
+    STREAMDECK_MK2,
+    STREAMDECK_MK2_SCISSOR,
+    STREAMDECK_ORIGINAL_V2,
+    STREAMDECK_XL,
+    STREAMDECK_XL_V2,
+    STREAMDECK_MINI,
+    STREAMDECK_MINI_MK2,
+):
+    register_profile(_profile)
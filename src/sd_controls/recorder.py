@@ -0,0 +1,150 @@
+import hashlib
+import struct
+import time
+from pathlib import Path
+from threading import Lock, Thread
+from typing import BinaryIO, Iterator
+
+from sd_controls.fakedevice import FakeHIDDevice
+
+# at the start of every log file, followed by the records
+_MAGIC = b"SDREC\x01"
+
+_SESSION = 0
+_INPUT = 1
+_IMAGE = 2
+
+# record type, start of the session as unix time
+_SESSION_RECORD = struct.Struct("<Bd")
+# record type, microseconds since the session start, key mask
+_INPUT_RECORD = struct.Struct("<BQI")
+# record type, microseconds since the session start, key, packet count, payload hash, size in bytes,
+# write duration in microseconds, success
+_IMAGE_RECORD = struct.Struct("<BQBH8sII?")
+_RECORDS = {_SESSION: _SESSION_RECORD, _INPUT: _INPUT_RECORD, _IMAGE: _IMAGE_RECORD}
+
+
+class SessionStart:
+    def __init__(self, started_at: float) -> None:
+        # unix time
+        self.started_at = started_at
+
+
+class InputRecord:
+    def __init__(self, at: float, key_mask: int) -> None:
+        # seconds since the start of the session
+        self.at = at
+        self.key_mask = key_mask
+
+
+class ImageRecord:
+    def __init__(
+        self, at: float, key: int, packets: int, digest: bytes, size: int, duration: float, success: bool
+    ) -> None:
+        # seconds since the start of the session
+        self.at = at
+        self.key = key
+        self.packets = packets
+        # hash of the written packets, equal images have equal hashes
+        self.digest = digest
+        self.size = size
+        # seconds spent writing the packets
+        self.duration = duration
+        self.success = success
+
+
+class SessionRecorder:
+    """
+    Appends the input reports and key image writes of a deck to a binary log. Records are streamed to the file
+    through a buffer of buffer_size bytes, so memory stays bounded for sessions of any length.
+    Attach it with deck.set_recorder(recorder) and close it to flush the buffer.
+    """
+
+    def __init__(self, path: str | Path, buffer_size: int = 64 * 1024) -> None:
+        self._file: BinaryIO | None = open(path, "ab", buffering=buffer_size)
+        self._lock = Lock()
+        self._start = time.perf_counter_ns()
+        with self._lock:
+            if self._file.tell() == 0:
+                self._file.write(_MAGIC)
+            # appending to an existing log starts a new session
+            self._file.write(_SESSION_RECORD.pack(_SESSION, time.time()))
+
+    def _now(self) -> int:
+        return (time.perf_counter_ns() - self._start) // 1000
+
+    def record_input(self, key_mask: int) -> None:
+        self._write(_INPUT_RECORD.pack(_INPUT, self._now(), key_mask))
+
+    def record_image(self, key: int, packets: tuple[bytes, ...], duration: float, success: bool) -> None:
+        digest = hashlib.blake2b(digest_size=8)
+        for packet in packets:
+            digest.update(packet)
+        size = sum(len(packet) for packet in packets)
+        record = _IMAGE_RECORD.pack(
+            _IMAGE, self._now(), key, len(packets), digest.digest(), size, int(duration * 1e6), success
+        )
+        self._write(record)
+
+    def _write(self, record: bytes) -> None:
+        with self._lock:
+            # records arriving after close, e.g. from a writer thread, are dropped
+            if self._file is not None:
+                self._file.write(record)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_session(path: str | Path) -> Iterator[SessionStart | InputRecord | ImageRecord]:
+    """
+    Streams the records of a log, a record cut off at the end of the file (e.g. after a crash) is ignored
+    """
+    with open(path, "rb") as file:
+        if file.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a session log")
+        while record_type := file.read(1):
+            record_struct = _RECORDS.get(record_type[0])
+            if record_struct is None:
+                raise ValueError(f"unknown record type {record_type[0]} in {path}")
+            data = record_type + file.read(record_struct.size - 1)
+            if len(data) < record_struct.size:
+                return
+            if record_struct is _SESSION_RECORD:
+                yield SessionStart(record_struct.unpack(data)[1])
+            elif record_struct is _INPUT_RECORD:
+                _, at, key_mask = record_struct.unpack(data)
+                yield InputRecord(at / 1e6, key_mask)
+            else:
+                _, at, key, packets, digest, size, duration, success = record_struct.unpack(data)
+                yield ImageRecord(at / 1e6, key, packets, digest, size, duration / 1e6, success)
+
+
+def input_script(path: str | Path) -> Iterator[tuple[float, int]]:
+    """
+    The recorded key masks as (seconds since start, mask) pairs, sessions of one log are played back to back
+    """
+    offset = 0.0
+    last = 0.0
+    for record in read_session(path):
+        if isinstance(record, SessionStart):
+            offset = last
+        elif isinstance(record, InputRecord):
+            last = offset + record.at
+            yield last, record.key_mask
+
+
+def replay_session(path: str | Path, device: FakeHIDDevice, speed: float = 1.0) -> Thread:
+    """
+    Feeds the recorded input into a fake device with the original timing, speed > 1 replays faster.
+    The log is read while it is played, so long sessions are not loaded into memory.
+    """
+    return device.play(input_script(path), speed)
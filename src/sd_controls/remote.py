@@ -0,0 +1,289 @@
+import asyncio
+import hashlib
+import logging
+import struct
+from collections import deque
+from concurrent.futures import Future
+from io import BytesIO
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator
+
+from PIL import Image
+
+from sd_controls.deviceimage import DeviceImage
+from sd_controls.encoder import EncodeQuality, JpegEncoder
+from sd_controls.profiles import STREAMDECK_MK2, DeviceProfile, ImageFormat, get_profile
+from sd_controls.streamdeck import HardwareStreamDeck
+
+if TYPE_CHECKING:
+    from sd_controls.sdsystem import SDSystem
+
+# every message is the message type and the payload length followed by the payload
+_FRAME = struct.Struct("<BI")
+
+# client to server, each request is answered with MSG_RESULT in the order of the requests
+# key, then the image encoded for the deck (a JPEG, or a bitmap for decks that use them) in its size and rotation
+MSG_SET_KEY_JPEG = 1
+# key, then complete HID reports for the deck key as built by RemoteClient.build_packets
+MSG_SET_KEY_PACKETS = 2
+# no payload, key events are sent to the client from then on
+MSG_SUBSCRIBE = 3
+# the app id as UTF-8
+MSG_LAUNCH_APP = 4
+
+# server to client
+# sent once after connecting: _HELLO followed by the deck key of every key
+MSG_HELLO = 16
+MSG_RESULT = 17
+MSG_KEY_EVENT = 18
+
+# key count, icon size, image rotation, vendor and product id (0 for decks without HID reports)
+_HELLO = struct.Struct("<BHHHH")
+_RESULT = struct.Struct("<?")
+# pressed and released keys as bit masks
+_KEY_EVENT = struct.Struct("<II")
+
+
+class RemoteServer:
+    """
+    Serves an SDSystem on a unix domain socket, so other processes can set keys, receive key events and launch
+    apps without embedding sd_controls. Key images are decoded and checked on worker threads and then set on
+    the event loop like any app's; a deck with a write thread keeps slow writes off the loop.
+    """
+
+    def __init__(
+        self,
+        system: "SDSystem",
+        path: str | Path,
+        max_message_size: int = 1024 * 1024,
+        max_pending_events: int = 64 * 1024,
+    ) -> None:
+        self._system = system
+        self._path = path
+        self._max_message_size = max_message_size
+        # subscribers with more unsent event bytes than this are disconnected
+        self._max_pending_events = max_pending_events
+        self._server: asyncio.AbstractServer | None = None
+        self._clients: set[asyncio.StreamWriter] = set()
+        self._subscribers: set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_unix_server(self._handle, path=str(self._path))
+        self._system.add_key_listener(self._key_event)
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        self._system.remove_key_listener(self._key_event)
+        self._server.close()
+        self._server = None
+        for writer in self._clients:
+            writer.close()
+
+    def get_client_count(self) -> int:
+        return len(self._clients)
+
+    def _hello(self) -> bytes:
+        system = self._system
+        deck = system.get_deck()
+        if isinstance(deck, HardwareStreamDeck):
+            ids = (deck.get_profile().vendor_id, deck.get_profile().product_id)
+        else:
+            ids = (0, 0)
+        key_count = system.get_key_count()
+        key_map = bytes(system.get_deck_key(key) for key in range(key_count))
+        return _HELLO.pack(key_count, deck.get_icon_size(), system.get_rotation(), *ids) + key_map
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients.add(writer)
+        try:
+            _send(writer, MSG_HELLO, self._hello())
+            while True:
+                message_type, length = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+                if length > self._max_message_size:
+                    logging.error(f"Remote client sent a message of {length} bytes, disconnecting")
+                    break
+                payload = await reader.readexactly(length)
+                result = await self._dispatch(writer, message_type, payload)
+                _send(writer, MSG_RESULT, _RESULT.pack(result))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            self._subscribers.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, writer: asyncio.StreamWriter, message_type: int, payload: bytes) -> bool:
+        if message_type in (MSG_SET_KEY_JPEG, MSG_SET_KEY_PACKETS):
+            if not payload or payload[0] >= self._system.get_key_count():
+                return False
+            key = payload[0]
+            image = await asyncio.to_thread(self._key_image, message_type, key, payload[1:])
+            if image is None:
+                return False
+            # set on the loop, so remote updates are ordered with the frames and updates of the apps
+            result = self._system.set_key(key, image)
+            if isinstance(result, Future):
+                return await asyncio.wrap_future(result)
+            return result
+        if message_type == MSG_SUBSCRIBE:
+            self._subscribers.add(writer)
+            return True
+        if message_type == MSG_LAUNCH_APP:
+            return self._system.launch_app(payload.decode(errors="replace"))
+        return False
+
+    def _key_image(self, message_type: int, key: int, data: bytes) -> DeviceImage | None:
+        system = self._system
+        try:
+            if message_type == MSG_SET_KEY_JPEG:
+                deck = system.get_deck()
+                # decks without HID reports take JPEGs, like RemoteClient.encode_image produces for them
+                image_format = (
+                    deck.get_profile().image_format if isinstance(deck, HardwareStreamDeck) else ImageFormat.JPEG
+                )
+                image = _jpeg_image(data, system.get_rotation(), image_format)
+                icon_size = deck.get_icon_size()
+                if icon_size and image.size != (icon_size, icon_size):
+                    return None
+            else:
+                deck = system.get_deck()
+                if not isinstance(deck, HardwareStreamDeck):
+                    return None
+                report_length = deck.get_profile().image_report_length
+                packets = tuple(data[start : start + report_length] for start in range(0, len(data), report_length))
+                image = deck.adopt_packets(system.get_deck_key(key), packets, system.get_rotation())
+        except (ValueError, OSError) as e:
+            logging.error(f"Invalid image from remote client for key {key}: {e}")
+            return None
+        return image
+
+    def _key_event(self, pressed: int, released: int) -> None:
+        if not self._subscribers:
+            return
+        event = _FRAME.pack(MSG_KEY_EVENT, _KEY_EVENT.size) + _KEY_EVENT.pack(pressed, released)
+        for writer in list(self._subscribers):
+            # events are never awaited, a subscriber which doesn't keep up is dropped instead
+            if writer.transport.get_write_buffer_size() > self._max_pending_events:
+                logging.error("Remote client does not read its key events, disconnecting")
+                self._subscribers.discard(writer)
+                writer.close()
+                continue
+            writer.write(event)
+
+
+def _send(writer: asyncio.StreamWriter, message_type: int, payload: bytes) -> None:
+    writer.write(_FRAME.pack(message_type, len(payload)) + payload)
+
+
+def _jpeg_image(data: bytes, rotation: int, image_format: ImageFormat) -> DeviceImage:
+    # Image.open only parses the header, the pixels are decoded if a deck without HID reports needs them
+    image = Image.open(BytesIO(data))
+    # the data is written to the deck as it is, so it must be in the format the deck decodes
+    if image.format != image_format.name:
+        raise ValueError(f"{image.format} image where the deck takes {image_format.name}")
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    return DeviceImage(image, rotation, digest, digest, data)
+
+
+class RemoteClient:
+    """
+    Client of a RemoteServer. Requests may be issued concurrently, they are pipelined on one connection.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, hello: bytes) -> None:
+        self._reader = reader
+        self._writer = writer
+        self.key_count, self.icon_size, self.rotation, vendor_id, product_id = _HELLO.unpack_from(hello)
+        # deck key of every key, packets address the deck's keys
+        self.key_map = list(hello[_HELLO.size :])
+        # None if the deck has no HID reports, e.g. a headless deck
+        self.profile: DeviceProfile | None = get_profile(vendor_id, product_id)
+        self._results: deque[asyncio.Future] = deque()
+        self._events: asyncio.Queue[tuple[int, int] | None] = asyncio.Queue()
+        if self.profile is not None:
+            self._encoder = self.profile.create_encoder()
+        else:
+            # decks without HID reports take JPEGs sized like the Mk.2's
+            self._encoder = JpegEncoder(self.icon_size, STREAMDECK_MK2.image_payload_length)
+        self._reader_task = asyncio.create_task(self._read_messages())
+
+    @classmethod
+    async def connect(cls, path: str | Path) -> "RemoteClient":
+        reader, writer = await asyncio.open_unix_connection(str(path))
+        message_type, length = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+        if message_type != MSG_HELLO:
+            writer.close()
+            raise ConnectionError(f"Unexpected message {message_type} from {path}")
+        return cls(reader, writer, await reader.readexactly(length))
+
+    def encode_image(self, image: Image.Image, quality: EncodeQuality = EncodeQuality.FULL) -> bytes:
+        """
+        Resizes, rotates and encodes an image in the deck's format, the result can be sent with set_key_jpeg
+        """
+        if self.icon_size and image.size != (self.icon_size, self.icon_size):
+            image = image.resize((self.icon_size, self.icon_size))
+        if self.rotation:
+            image = image.rotate(self.rotation)
+        if self.profile is not None and self.profile.image_transpose is not None:
+            image = image.transpose(self.profile.image_transpose)
+        return self._encoder.encode(image, quality)
+
+    def build_packets(self, key: int, jpeg: bytes) -> tuple[bytes, ...]:
+        """
+        Splits an encoded image into the deck's HID reports for key, the host then writes them unchanged
+        """
+        if self.profile is None:
+            raise ValueError("The deck has no HID reports")
+        return self.profile.build_image_reports(self.key_map[key], jpeg)
+
+    async def set_key_jpeg(self, key: int, jpeg: bytes) -> bool:
+        return await self._request(MSG_SET_KEY_JPEG, bytes([key]) + jpeg)
+
+    async def set_key_packets(self, key: int, packets: tuple[bytes, ...]) -> bool:
+        return await self._request(MSG_SET_KEY_PACKETS, bytes([key]) + b"".join(packets))
+
+    async def set_key_image(self, key: int, image: Image.Image, quality: EncodeQuality = EncodeQuality.FULL) -> bool:
+        return await self.set_key_jpeg(key, self.encode_image(image, quality))
+
+    async def launch_app(self, app_id: str) -> bool:
+        return await self._request(MSG_LAUNCH_APP, app_id.encode())
+
+    async def subscribe(self) -> None:
+        await self._request(MSG_SUBSCRIBE, b"")
+
+    async def events(self) -> AsyncIterator[tuple[int, int]]:
+        """
+        Yields (pressed, released) key masks after subscribe() until the connection is closed
+        """
+        while (event := await self._events.get()) is not None:
+            yield event
+
+    async def _request(self, message_type: int, payload: bytes) -> bool:
+        result = asyncio.get_running_loop().create_future()
+        self._results.append(result)
+        _send(self._writer, message_type, payload)
+        await self._writer.drain()
+        return await result
+
+    async def _read_messages(self) -> None:
+        try:
+            while True:
+                message_type, length = _FRAME.unpack(await self._reader.readexactly(_FRAME.size))
+                payload = await self._reader.readexactly(length)
+                if message_type == MSG_RESULT:
+                    self._results.popleft().set_result(_RESULT.unpack(payload)[0])
+                elif message_type == MSG_KEY_EVENT:
+                    self._events.put_nowait(_KEY_EVENT.unpack(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            while self._results:
+                self._results.popleft().set_exception(ConnectionError("Connection to the server closed"))
+            self._events.put_nowait(None)
+
+    async def close(self) -> None:
+        self._writer.close()
+        await self._writer.wait_closed()
+        await self._reader_task
@@ -0,0 +1,202 @@
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from queue import SimpleQueue
+from threading import Lock, Thread
+from typing import Callable, Hashable
+
+from PIL import Image
+
+from sd_controls.encoder import BmpEncoder, EncodeQuality, JpegEncoder
+from sd_controls.profiles import DeviceProfile
+
+# receives the reports of a rendered key image, or None if rendering failed
+Deliver = Callable[[tuple[bytes, ...] | None], None]
+
+
+def _encode(
+    image: Image.Image,
+    profile: DeviceProfile,
+    encoder: JpegEncoder | BmpEncoder,
+    rotation: int,
+    quality: EncodeQuality,
+) -> bytes:
+    # the same steps as SDSystem._prepare_image and HardwareStreamDeck.encode_image, so the reports are identical
+    icon_size = profile.icon_size
+    if image.size != (icon_size, icon_size):
+        image = image.resize((icon_size, icon_size))
+    if rotation:
+        image = image.rotate(rotation)
+    if profile.image_transpose is not None:
+        image = image.transpose(profile.image_transpose)
+    return encoder.encode(image, quality)
+
+
+def _render(
+    image: Image.Image,
+    profile: DeviceProfile,
+    encoder: JpegEncoder | BmpEncoder,
+    key: int,
+    rotation: int,
+    quality: EncodeQuality,
+) -> tuple[bytes, ...]:
+    return profile.build_image_reports(key, _encode(image, profile, encoder, rotation, quality))
+
+
+def _render_shared(
+    image: Image.Image,
+    profile: DeviceProfile,
+    encoder: JpegEncoder | BmpEncoder,
+    key: int,
+    rotation: int,
+    quality: EncodeQuality,
+) -> tuple[str, int]:
+    """
+    Renders in a worker process, the reports are left in a shared memory block which the pool unlinks
+    """
+    reports = _render(image, profile, encoder, key, rotation, quality)
+    report_length = profile.image_report_length
+    block = SharedMemory(create=True, size=len(reports) * report_length)
+    # the pool owns the block from here on, it is tracked when the pool attaches to it
+    resource_tracker.unregister(block._name, "shared_memory")
+    try:
+        for index, report in enumerate(reports):
+            block.buf[index * report_length : (index + 1) * report_length] = report
+        return block.name, len(reports)
+    except BaseException:
+        block.unlink()
+        raise
+    finally:
+        block.close()
+
+
+def _collect_shared(name: str, count: int, report_length: int) -> tuple[bytes, ...]:
+    block = SharedMemory(name=name)
+    try:
+        view = block.buf
+        # hidapi and the frame cache need bytes, every report is copied out of the block once
+        return tuple(bytes(view[index * report_length : (index + 1) * report_length]) for index in range(count))
+    finally:
+        block.close()
+        block.unlink()
+
+
+class _Channel:
+    def __init__(self) -> None:
+        self.submitted = 0
+        self.delivered = 0
+        # finished jobs waiting for an earlier job of the channel
+        self.completed: dict[int, tuple[Deliver, tuple[bytes, ...] | None]] = {}
+
+
+class RenderPool:
+    """
+    Resizes, rotates, encodes and packetizes key images on worker processes, so a full redraw of several decks
+    is not bound to the core of the event loop. One pool can be shared by the systems of all decks.
+    The reports come back through shared memory. Results of a channel, e.g. a key of a system, are delivered
+    in the order the jobs were submitted, one at a time on the pool's delivery thread.
+    With processes=False the jobs run on threads, which only scales as far as Pillow releases the GIL.
+    """
+
+    def __init__(self, workers: int | None = None, processes: bool = True) -> None:
+        self._worker_count = workers or os.cpu_count() or 1
+        self._processes = processes
+        self._executor: Executor | None = None
+        self._lock = Lock()
+        self._channels: dict[Hashable, _Channel] = defaultdict(_Channel)
+        self._completions: SimpleQueue = SimpleQueue()
+        self._delivery_thread: Thread | None = None
+        self._closed = False
+        self.rendered = 0
+        self.failed = 0
+
+    def get_worker_count(self) -> int:
+        return self._worker_count
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def _get_executor(self) -> Executor:
+        # worker processes are only started for the first job, they take a while to import Pillow
+        if self._executor is None:
+            if self._processes:
+                self._executor = ProcessPoolExecutor(max_workers=self._worker_count)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._worker_count, thread_name_prefix="sd-controls-render"
+                )
+            self._delivery_thread = Thread(target=self._deliver_results, name="sd-controls-render", daemon=True)
+            self._delivery_thread.start()
+        return self._executor
+
+    def submit(
+        self,
+        channel: Hashable,
+        profile: DeviceProfile,
+        encoder: JpegEncoder | BmpEncoder,
+        key: int,
+        image: Image.Image,
+        rotation: int,
+        quality: EncodeQuality,
+        deliver: Deliver,
+    ) -> None:
+        """
+        Renders image for key of a deck with the given profile and encoder and passes its reports to deliver.
+        deliver is never called from the submitting thread, so it may take locks the caller holds.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The render pool is closed")
+            executor = self._get_executor()
+            state = self._channels[channel]
+            sequence = state.submitted
+            state.submitted += 1
+            render = _render_shared if self._processes else _render
+            try:
+                future = executor.submit(render, image, profile, encoder, key, rotation, quality)
+            except RuntimeError as e:
+                # a broken process pool, reported like a failed job so the channel's order is kept
+                future = Future()
+                future.set_exception(e)
+        report_length = profile.image_report_length
+        future.add_done_callback(
+            lambda done: self._completions.put((channel, sequence, key, report_length, deliver, done))
+        )
+
+    def _deliver_results(self) -> None:
+        while (completion := self._completions.get()) is not None:
+            channel, sequence, key, report_length, deliver, future = completion
+            try:
+                result = future.result()
+                packets = _collect_shared(*result, report_length) if self._processes else result
+                self.rendered += 1
+            except Exception as e:
+                logging.error(f"Error rendering the image of key {key}: {e}")
+                packets = None
+                self.failed += 1
+            state = self._channels[channel]
+            state.completed[sequence] = (deliver, packets)
+            while state.delivered in state.completed:
+                deliver, packets = state.completed.pop(state.delivered)
+                state.delivered += 1
+                try:
+                    deliver(packets)
+                except Exception as e:
+                    logging.error(f"Error delivering the image of key {key}: {e}")
+
+    def close(self) -> None:
+        """
+        Finishes and delivers all submitted jobs, then stops the workers
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._completions.put(None)
+        self._delivery_thread.join()
@@ -1,26 +1,50 @@
 import asyncio
 import inspect
 import logging
+import time
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
 from enum import Enum
 from functools import cache
 from pathlib import Path
 from threading import Lock
-from typing import Callable, Iterator
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Coroutine, Generator, Iterator
 
-import hid
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 
 import sd_controls
+from sd_controls.animation import Animation, AnimationScheduler
+from sd_controls.callbacks import CallbackExecutor
+from sd_controls.deviceimage import DeviceImage
+from sd_controls.encoder import EncodeQuality
+from sd_controls.framecache import image_digest
+from sd_controls.labels import draw_label
+from sd_controls.lazyimport import lazy_import
+from sd_controls.metrics import metrics
+from sd_controls.profiles import get_profile, get_vendor_ids
+from sd_controls.remote import RemoteServer
 from sd_controls.sprites import Sprites
-from sd_controls.streamdeck import StreamDeck, StreamDeckMk2
+from sd_controls.streamdeck import HardwareStreamDeck, StreamDeck, iter_mask_keys, mask_to_keys
+
+if TYPE_CHECKING:
+    from sd_controls.renderpool import RenderPool
+
+hid = lazy_import("hid")
+ImageFont = lazy_import("PIL.ImageFont")
 
 _LIB_PATH = Path(__file__).parent
 _FONT_PATH = _LIB_PATH / "fonts"
 
+_LABELED_IMG_CACHE_SIZE = 256
+# encoded launchpad icons, keyed by icon content
+_LAUNCHPAD_ICON_CACHE_SIZE = 256
+_labeled_imgs: OrderedDict[tuple, Image.Image] = OrderedDict()
+_labeled_imgs_lock = Lock()
 
-_DEVICE_VID_ELGATO = 0x0FD9
+# keeps closing tasks of stopped apps alive until they are done
+_closing_tasks: set[asyncio.Task] = set()
 
 
 class NoStreamDeckFoundExcpetion(Exception):
@@ -33,69 +57,258 @@ class Orientation(Enum):
 
 
 class SDSystem:
-    def __init__(self, orientation=Orientation.DEFAULT, timeout: int = 0, deck: StreamDeck | None = None) -> None:
+    def __init__(
+        self,
+        orientation=Orientation.DEFAULT,
+        timeout: int = 0,
+        deck: StreamDeck | None = None,
+        render_pool: "RenderPool | None" = None,
+    ) -> None:
         print(f"Initialising SD-Controls {sd_controls.__version__})...")
         self._apps: list["SDUserApp"] = []
-        self._deck: StreamDeck = deck
+        self._selected_deck: StreamDeck | None = None
         self._running_app: _SDApp = None
         self._key_lock = Lock()
         self._orientation = orientation
         self._default_timeout = timeout
         self._key_map = []
-        self._connect()
-
-    def _connect(self):
-        if not self._deck:
+        self._key_unmap = []
+        self._rotation = 0
+        # what is currently shown on each physical key: (content digest, image as sent to the deck),
+        # the image is None while the render pool prepares it
+        self._key_state: list[tuple[bytes, DeviceImage | None] | None] = []
+        self._key_synced: list[bool] = []
+        self._frame_depth = 0
+        self._frame_updates: dict[int, tuple[Image.Image | DeviceImage, bool]] = {}
+        # set when the system should wait for a replacement deck instead of stopping on a disconnect
+        self._reattached: asyncio.Event | None = None
+        self._closed = False
+        self._animator: AnimationScheduler | None = None
+        self._callback_executor: CallbackExecutor | None = None
+        self._app_index: dict[str, "SDUserApp"] = {}
+        self._app_groups: dict[str | None, list["SDUserApp"]] = {}
+        self._launchpad_pages: list[list["SDUserApp"]] | None = None
+        self._launchpad_page = 0
+        self._launchpad_icons: OrderedDict[bytes, DeviceImage] = OrderedDict()
+        self._launchpad_lock = Lock()
+        self._key_listeners: list[Callable[[int, int], None]] = []
+        # optional worker pool which prepares key images of hardware decks, it may be shared with other systems
+        self._render_pool = render_pool
+        if deck:
+            self._connect(deck)
+
+    @property
+    def _deck(self) -> StreamDeck:
+        # USB enumeration is deferred until the deck is used for the first time
+        if self._selected_deck is None:
+            self._connect()
+        return self._selected_deck
+
+    @_deck.setter
+    def _deck(self, deck: StreamDeck) -> None:
+        self._selected_deck = deck
+
+    def _connect(self, deck: StreamDeck | None = None):
+        if not deck:
             decks = SDSystem.find_streamdecks()
             if len(decks) == 0:
                 raise NoStreamDeckFoundExcpetion("There is no streamdeck available")
-            self._deck: StreamDeck = decks[0]
-            print("Selected", self._deck)
+            deck = decks[0]
+            print("Selected", deck)
+        self._selected_deck = deck
         self._create_key_map()
-        self._deck.add_event_listener(self._system_key_listener)
+        self._deck.add_key_listener(self._system_key_listener)
 
     def start(self) -> None:
-        self._deck.set_standby_timeout(self._default_timeout)
         try:
-            print("Started StreamDeck System")
-            # starts launchpad
-            self.close_app()
-            asyncio.run(self._deck.run())
+            asyncio.run(self.run())
         except KeyboardInterrupt:
             self.close()
             print("Stream Deck System shutdown")
 
-    def register_app(self, app: "SDUserApp") -> None:
+    async def run(self) -> None:
+        """
+        Starts the launchpad and handles the deck's key events until it stops
+        """
+        self._deck.set_standby_timeout(self._default_timeout)
+        print("Started StreamDeck System")
+        # starts launchpad
+        self.close_app()
+        while True:
+            await self._deck.run()
+            if self._deck.is_connected() or self._reattached is None:
+                break
+            print("Lost", self._deck)
+            await self._reattached.wait()
+            self._reattached.clear()
+
+    def get_deck(self) -> StreamDeck:
+        return self._deck
+
+    def wait_for_reattach(self) -> None:
+        """
+        Keeps run() alive when the deck disconnects, until a new deck is passed to attach_deck
+        """
+        self._reattached = asyncio.Event()
+
+    def attach_deck(self, deck: StreamDeck) -> None:
+        """
+        Replaces a disconnected deck of the same model and replays the current key images on it
+        """
+        old_deck = self._deck
+        old_deck.clear_event_listeners()
+        old_deck.stop()
+        deck.set_brightness(old_deck.get_brightness())
+        deck.set_standby_timeout(self._default_timeout)
+        deck.add_key_listener(self._system_key_listener)
+        self._deck = deck
+        print("Reattached", self._deck)
+        self.invalidate_keys()
+        self.refresh_deck()
+        if self._reattached:
+            self._reattached.set()
+
+    def register_app(self, app: "SDUserApp", group: str | None = None) -> None:
+        """
+        Adds an app to the launchpad. Apps of a group share launchpad pages, every group starts on a new page.
+        """
+        app_id = app.get_id()
+        registered = self._app_index.get(app_id)
+        if registered is not None and registered.has_app_id() and app.has_app_id():
+            raise ValueError(f"An app with the id {app_id!r} is already registered")
         self._apps.append(app)
+        # apps identified by their name may share it, launch_app starts the first one unless an app_id claims it
+        if registered is None or (app.has_app_id() and not registered.has_app_id()):
+            self._app_index[app_id] = app
+        self._app_groups.setdefault(group, []).append(app)
+        self._launchpad_pages = None
 
     def get_apps(self) -> list["SDUserApp"]:
         return self._apps
 
+    def get_app(self, app_id: str) -> "SDUserApp | None":
+        return self._app_index.get(app_id)
+
+    def launch_app(self, app_id: str) -> bool:
+        """
+        Starts a registered app by its id, e.g. from an external trigger. Returns False for unknown ids.
+        """
+        app = self._app_index.get(app_id)
+        if app is None:
+            return False
+        if self._running_app is not app:
+            self._stop_running_app()
+            self._start_app(app)
+        return True
+
+    def get_launchpad_pages(self) -> list[list["SDUserApp"]]:
+        """
+        The apps on each launchpad page. With more apps than keys the last two keys of every page navigate.
+        """
+        if self._launchpad_pages is None:
+            key_count = self.get_key_count()
+            if len(self._apps) <= key_count and len(self._app_groups) <= 1:
+                self._launchpad_pages = [list(self._apps)]
+            else:
+                per_page = key_count - 2
+                self._launchpad_pages = [
+                    apps[start : start + per_page]
+                    for apps in self._app_groups.values()
+                    for start in range(0, len(apps), per_page)
+                ]
+        return self._launchpad_pages
+
+    def _launchpad_page_icons(self, page: int) -> dict[int, Image.Image]:
+        # calls the apps' get_icon, so it must run on the event loop
+        pages = self.get_launchpad_pages()
+        icons = {key: app.get_icon() for key, app in enumerate(pages[page])}
+        if len(pages) > 1:
+            key_count = self.get_key_count()
+            # the navigation labels are drawn at the deck's icon size, centered on the key
+            icon_size = self._deck.get_icon_size() or Sprites.CLEAR.size[0]
+            base = Sprites.CLEAR
+            if base.size != (icon_size, icon_size):
+                base = base.resize((icon_size, icon_size))
+            center = (icon_size // 2, icon_size // 2)
+            icons[key_count - 2] = SDUserApp.generate_labeled_img(base, "<", center, font_size=icon_size // 3)
+            icons[key_count - 1] = SDUserApp.generate_labeled_img(
+                base, f"{page + 1}/{len(pages)} >", center, font_size=icon_size // 4
+            )
+        return icons
+
+    def _launchpad_page_images(self, page: int) -> dict[int, DeviceImage]:
+        return self._launchpad_images(self._launchpad_page_icons(page))
+
+    def _launchpad_images(self, icons: dict[int, Image.Image]) -> dict[int, DeviceImage]:
+        return {key: self._launchpad_icon(icon) for key, icon in icons.items()}
+
+    def _launchpad_icon(self, icon: Image.Image) -> DeviceImage:
+        digest = image_digest(icon)
+        with self._launchpad_lock:
+            prepared = self._launchpad_icons.get(digest)
+            if prepared is not None:
+                self._launchpad_icons.move_to_end(digest)
+                return prepared
+        prepared = self._prepare_image(icon, digest, True)
+        with self._launchpad_lock:
+            self._launchpad_icons[digest] = prepared
+            while len(self._launchpad_icons) > _LAUNCHPAD_ICON_CACHE_SIZE:
+                self._launchpad_icons.popitem(last=False)
+        return prepared
+
+    def _prefetch_launchpad_page(self, page: int) -> None:
+        # the icons are fetched here, only resizing, rotating and encoding them runs on a worker thread,
+        # so flipping to the page needs no Pillow work
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        future = loop.run_in_executor(None, self._launchpad_images, self._launchpad_page_icons(page))
+        future.add_done_callback(_report_prefetch_result)
+
     def clear_deck(self) -> None:
-        for key in range(self.get_key_count()):
-            self._deck.set_key_image(key, Sprites.CLEAR)
+        images = {key: Sprites.CLEAR for key in range(self.get_key_count())}
         if self._is_user_app_running():
-            self.set_back_btn()
+            images[0] = Sprites.BACK_BTN
+        self.set_keys(images)
 
     def _create_key_map(self):
         key_indices = range(0, self.get_key_count())
         match self._orientation:
             case Orientation.FLIPPED_180:
                 self._key_map = list(reversed(key_indices))
+                self._rotation = (self._deck.get_image_rotation() + 180) % 360
             case _:
                 self._key_map = list(key_indices)
+                self._rotation = self._deck.get_image_rotation() % 360
+        self._key_unmap = [0] * len(self._key_map)
+        for key, deck_key in enumerate(self._key_map):
+            self._key_unmap[deck_key] = key
+        self._key_state = [None] * self.get_key_count()
+        self._key_synced = [False] * self.get_key_count()
+        self._launchpad_pages = None
+        self._launchpad_icons.clear()
 
     def _start_app(self, app: "_SDApp"):
+        start = time.perf_counter() if metrics.enabled else 0.0
         self._running_app: _SDApp = app
-        self.clear_deck()
-        self._running_app.start(self)
-
-    def close_app(self, shutdown=False):
+        # keys the new app draws right away are never cleared on the device first
+        with self.frame():
+            self.clear_deck()
+            self._running_app.start(self)
+        if metrics.enabled:
+            metrics.observe("app_switch", time.perf_counter() - start)
+
+    def _stop_running_app(self) -> None:
+        if self._animator:
+            self._animator.stop()
         if self._running_app:
             self._running_app.stop()
             self._running_app.closed()
             self._running_app = None
 
+    def close_app(self, shutdown=False):
+        self._stop_running_app()
         if not shutdown:
             self._start_app(_LaunchPad())
 
@@ -105,12 +318,234 @@ class SDSystem:
     def set_back_btn(self):
         self.set_key(0, Sprites.BACK_BTN)
 
-    def set_key(self, key: int, image: Image.Image) -> bool:
-        self._key_lock.acquire()
-        if self._orientation == Orientation.DEFAULT:
-            image = image.rotate(180)
-        result = self._deck.set_key_image(self._key_map[key], image)
-        self._key_lock.release()
+    def set_key(self, key: int, image: Image.Image | DeviceImage, force: bool = False) -> bool | Future:
+        with self._locked_keys():
+            if self._frame_depth > 0:
+                self._frame_updates[key] = (image, force)
+                return True
+            return self._write_keys({self._key_map[key]: (image, force)})[self._key_map[key]]
+
+    def set_keys(self, images: dict[int, Image.Image | DeviceImage], force: bool = False) -> dict[int, bool | Future]:
+        """
+        Updates several keys at once, all images are encoded before they are written in one burst
+        """
+        with self._locked_keys():
+            if self._frame_depth > 0:
+                self._frame_updates.update({key: (image, force) for key, image in images.items()})
+                return {key: True for key in images}
+            results = self._write_keys({self._key_map[key]: (image, force) for key, image in images.items()})
+        return {key: results[self._key_map[key]] for key in images}
+
+    @contextmanager
+    def frame(self) -> Generator[None, None, None]:
+        """
+        Collects all key updates made inside the block and commits them together when it is left.
+        The frame belongs to the system, so updates from threaded callbacks during the block join it.
+        """
+        with self._key_lock:
+            self._frame_depth += 1
+        try:
+            yield
+        finally:
+            with self._locked_keys():
+                self._frame_depth -= 1
+                if self._frame_depth == 0 and self._frame_updates:
+                    updates = self._frame_updates
+                    self._frame_updates = {}
+                    self._write_keys({self._key_map[key]: update for key, update in updates.items()})
+
+    @contextmanager
+    def _locked_keys(self) -> Generator[None, None, None]:
+        if not metrics.enabled:
+            with self._key_lock:
+                yield
+            return
+        start = time.perf_counter()
+        with self._key_lock:
+            metrics.observe("key_lock_wait", time.perf_counter() - start)
+            yield
+
+    def set_key_quality(self, key: int, quality: EncodeQuality) -> None:
+        """
+        Sets the image quality of a key, fast changing keys use fewer packets with EncodeQuality.FAST
+        """
+        self._deck.set_key_quality(self._key_map[key], quality)
+
+    def get_rotation(self) -> int:
+        return self._rotation
+
+    def get_callback_executor(self) -> CallbackExecutor:
+        """
+        The thread pool which runs threaded key callbacks of this system's apps
+        """
+        if self._callback_executor is None:
+            self._callback_executor = CallbackExecutor()
+        return self._callback_executor
+
+    def get_animator(self) -> AnimationScheduler:
+        if self._animator is None:
+            self._animator = AnimationScheduler(self)
+        return self._animator
+
+    def prepare_image(
+        self, image: Image.Image | DeviceImage, encode: bool = False, quality: EncodeQuality = EncodeQuality.FULL
+    ) -> DeviceImage:
+        """
+        Resizes and rotates an image for this system's deck and orientation.
+        The result can be passed to set_key any number of times without further PIL work,
+        with encode=True it also carries the deck's wire format in the given quality.
+        """
+        return self._prepare_image(image, None, encode, quality)
+
+    def _prepare_image(
+        self,
+        image: Image.Image | DeviceImage,
+        digest: bytes | None,
+        encode: bool,
+        quality: EncodeQuality = EncodeQuality.FULL,
+    ) -> DeviceImage:
+        if isinstance(image, DeviceImage):
+            if image.rotation == self._rotation and (image.encoded is not None or not encode):
+                return image
+            # prepared for another orientation
+            digest = image.digest
+            prepared = image.image.rotate((self._rotation - image.rotation) % 360)
+        else:
+            if digest is None:
+                digest = image_digest(image)
+            icon_size = self._deck.get_icon_size()
+            prepared = image
+            if icon_size and prepared.size != (icon_size, icon_size):
+                prepared = prepared.resize((icon_size, icon_size))
+            if self._rotation:
+                prepared = prepared.rotate(self._rotation)
+        return DeviceImage(
+            prepared,
+            self._rotation,
+            digest,
+            image_digest(prepared),
+            self._deck.encode_image(prepared, quality) if encode else None,
+        )
+
+    def _stage_key(self, deck_key: int, image: Image.Image | DeviceImage, force: bool) -> DeviceImage | None:
+        digest = image.digest if isinstance(image, DeviceImage) else image_digest(image)
+        state = self._key_state[deck_key]
+        if not force and self._key_synced[deck_key] and state[0] == digest:
+            return None
+
+        prepared = self._prepare_image(image, digest, False)
+        self._key_state[deck_key] = (digest, prepared)
+        return prepared
+
+    def _render_key(self, deck_key: int, image: Image.Image, force: bool) -> bool | Future:
+        digest = image_digest(image)
+        state = self._key_state[deck_key]
+        if not force and self._key_synced[deck_key] and state[0] == digest:
+            return True
+
+        self._key_state[deck_key] = (digest, None)
+        result = Future()
+
+        def deliver(packets: tuple[bytes, ...] | None) -> None:
+            if packets is None:
+                result.set_result(False)
+                return
+            with self._key_lock:
+                state = self._key_state[deck_key]
+                if self._closed or state is None or state[0] != digest:
+                    # a newer image was set for the key while this one was rendered
+                    result.set_result(True)
+                    return
+                deck = self._deck
+                prepared = deck.adopt_packets(deck_key, packets, self._rotation)
+                self._key_state[deck_key] = (digest, prepared)
+                written = deck.set_key_image(deck_key, prepared)
+            if isinstance(written, Future):
+                written.add_done_callback(
+                    lambda done: result.set_result(not done.cancelled() and done.exception() is None and done.result())
+                )
+            else:
+                result.set_result(written)
+
+        deck = self._deck
+        self._render_pool.submit(
+            (id(self), deck_key),
+            deck.get_profile(),
+            deck.get_encoder(),
+            deck_key,
+            image,
+            self._rotation,
+            deck.get_key_quality(deck_key),
+            deliver,
+        )
+        return result
+
+    def _write_keys(self, updates: dict[int, tuple[Image.Image | DeviceImage, bool]]) -> dict[int, bool | Future]:
+        results = {}
+        staged = {}
+        render_pool = self._render_pool
+        # images are prepared here once the pool or the system is closed, deliver would drop the shutdown frame
+        render = (
+            render_pool is not None
+            and not render_pool.is_closed()
+            and not self._closed
+            and isinstance(self._deck, HardwareStreamDeck)
+        )
+        for deck_key, (image, force) in updates.items():
+            if render and not isinstance(image, DeviceImage):
+                result = self._render_key(deck_key, image, force)
+                if isinstance(result, Future):
+                    self._track_write(deck_key, result)
+                results[deck_key] = result
+                continue
+            prepared = self._stage_key(deck_key, image, force)
+            if prepared is None:
+                results[deck_key] = True
+            else:
+                staged[deck_key] = prepared
+        if staged:
+            for deck_key, result in self._deck.set_key_images(staged).items():
+                self._track_write(deck_key, result)
+                results[deck_key] = result
+        return results
+
+    def _track_write(self, deck_key: int, result: bool | Future) -> None:
+        if not isinstance(result, Future):
+            self._key_synced[deck_key] = result
+            return
+
+        # queued writes count as displayed until the deck reports a failure
+        self._key_synced[deck_key] = True
+        digest = self._key_state[deck_key][0]
+
+        def done(future: Future) -> None:
+            if future.cancelled() or future.exception() is not None or not future.result():
+                state = self._key_state[deck_key]
+                if state is not None and state[0] == digest:
+                    self._key_synced[deck_key] = False
+
+        result.add_done_callback(done)
+
+    def invalidate_keys(self) -> None:
+        """
+        Forgets what is displayed on the deck, so the next write to every key is sent to the device
+        """
+        with self._key_lock:
+            self._key_synced = [False] * self.get_key_count()
+
+    def refresh_deck(self) -> bool:
+        """
+        Re-sends the current image of every key, e.g. to recover after the device was reconnected
+        """
+        result = True
+        with self._key_lock:
+            for deck_key, state in enumerate(self._key_state):
+                if state is None or state[1] is None:
+                    # rendering keys are written once their image is ready
+                    continue
+                written = self._deck.set_key_image(deck_key, state[1])
+                self._track_write(deck_key, written)
+                result = result and (isinstance(written, Future) or written)
         return result
 
     def get_keys(self) -> Iterator[bool]:
@@ -120,15 +555,55 @@ class SDSystem:
             case _:
                 return self._deck.get_keys().__iter__()
 
+    def get_key_mask(self) -> int:
+        return self._to_key_mask(self._deck.get_key_mask())
+
     def get_key_count(self) -> int:
         return self._deck.get_key_count()
 
-    def _system_key_listener(self, deck: StreamDeck, keys_before: list[bool], keys: list[bool]):
-        if keys_before[self._key_map[0]] and not keys[self._key_map[0]] and self._is_user_app_running():
+    def get_deck_key(self, key: int) -> int:
+        """
+        The key of the deck which shows key in this system's orientation
+        """
+        return self._key_map[key]
+
+    def _to_key_mask(self, deck_mask: int) -> int:
+        if self._orientation == Orientation.DEFAULT:
+            return deck_mask
+        key_mask = 0
+        for deck_key in iter_mask_keys(deck_mask):
+            key_mask |= 1 << self._key_unmap[deck_key]
+        return key_mask
+
+    def add_key_listener(self, callback: Callable[[int, int], None]) -> None:
+        """
+        Registers a listener which is called with the masks of pressed and released keys in this system's
+        orientation before the running app handles them. Listeners survive a deck being reattached.
+        """
+        self._key_listeners.append(callback)
+
+    def remove_key_listener(self, callback: Callable[[int, int], None]) -> None:
+        self._key_listeners.remove(callback)
+
+    def _system_key_listener(self, deck: StreamDeck, pressed: int, released: int):
+        pressed = self._to_key_mask(pressed)
+        released = self._to_key_mask(released)
+        for listener in self._key_listeners:
+            listener(pressed, released)
+        if released & 1 and self._is_user_app_running():
             self.close_app()
             return
         if self._running_app:
-            self._running_app.key_event(keys_before, keys)
+            self._running_app.key_event(pressed, released)
+
+    async def serve_remote(self, path: str | Path) -> RemoteServer:
+        """
+        Lets other processes set keys, receive key events and launch apps over a unix domain socket,
+        see sd_controls.remote
+        """
+        server = RemoteServer(self, path)
+        await server.start()
+        return server
 
     def set_brightness(self, brightness: int) -> None:
         self._deck.set_brightness(brightness)
@@ -137,10 +612,22 @@ class SDSystem:
         self._deck.get_brightness()
 
     def _stop_deck(self) -> None:
-        if self._deck:
-            self._deck.stop()
+        if self._callback_executor:
+            self._callback_executor.shutdown()
+        if self._selected_deck:
+            self._selected_deck.stop()
 
     def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._selected_deck is None:
+            # never connected, there is nothing to clean up on a device
+            return
+        if not self._deck.is_connected():
+            self.close_app(shutdown=True)
+            self._stop_deck()
+            return
         self._deck.set_standby_timeout(1)
         self.close_app(shutdown=True)
         self.clear_deck()
@@ -150,24 +637,63 @@ class SDSystem:
         self.close()
 
     @staticmethod
-    def find_streamdecks() -> list[StreamDeck]:
-        streamdeck_map = {StreamDeckMk2._PID: StreamDeckMk2}
+    def enumerate_streamdecks() -> list[dict]:
+        """
+        Lists the hid device infos of all connected, supported Stream Decks without opening them
+        """
+        # only devices of known vendors are listed, the profile lookup then skips unsupported models
+        return [
+            device
+            for vendor_id in get_vendor_ids()
+            for device in hid.enumerate(vendor_id)
+            if get_profile(device["vendor_id"], device["product_id"]) is not None
+        ]
+
+    @staticmethod
+    def open_streamdeck(device: dict, **deck_options) -> StreamDeck:
+        profile = get_profile(device["vendor_id"], device["product_id"])
+        return HardwareStreamDeck(hid.Device(path=device["path"]), profile, **deck_options)
+
+    @staticmethod
+    def find_streamdecks(**deck_options) -> list[StreamDeck]:
+        """
+        Opens all connected Stream Decks, deck_options are passed on to the deck constructors
+        """
+        return [SDSystem.open_streamdeck(device, **deck_options) for device in SDSystem.enumerate_streamdecks()]
+
 
-        decks = []
+def _report_task_result(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Error in app task {task.get_name()}: {task.exception()}")
 
-        usb_devices = hid.enumerate()
-        for device in usb_devices:
-            if device["vendor_id"] == _DEVICE_VID_ELGATO and device["product_id"] in streamdeck_map:
-                decks.append((streamdeck_map[device["product_id"]])(hid.Device(path=device["path"])))
-        return decks
+
+def _report_prefetch_result(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logging.error(f"Error while prefetching a launchpad page: {future.exception()}")
+
+
+class _CallbackKind(Enum):
+    SYNC = 1
+    COROUTINE = 2
+    THREADED = 3
+
+
+_KeyCallback = tuple[Callable[[], Any], _CallbackKind]
 
 
 class _SDApp(ABC):
+    # run synchronous key callbacks on the system's callback thread pool instead of the event loop
+    _THREADED_CALLBACKS: bool = False
+
     def __init__(self) -> None:
         self._running = False
         self._system: SDSystem = None
-        self._key_up_callbacks: dict[int, list[Callable[[], None]]] = defaultdict(list)
-        self._key_down_callbacks: dict[int, list[Callable[[], None]]] = defaultdict(list)
+        self._key_up_callbacks: dict[int, list[_KeyCallback]] = defaultdict(list)
+        self._key_down_callbacks: dict[int, list[_KeyCallback]] = defaultdict(list)
+        # tasks started by the app, they are cancelled when the app is closed
+        self._tasks: set[asyncio.Task] = set()
+        # building full key lists is only worth it for apps that still implement keys_update
+        self._wants_key_lists = type(self).keys_update is not _SDApp.keys_update
 
     def clear_key_callbacks(self):
         """
@@ -176,23 +702,91 @@ class _SDApp(ABC):
         self._key_up_callbacks.clear()
         self._key_down_callbacks.clear()
 
-    def set_key(self, key: int, image: Image.Image):
+    def set_key(self, key: int, image: Image.Image | DeviceImage, force: bool = False):
         if not self._check_system():
             return False
 
         if 0 < key < self._system.get_key_count():
-            return self._system.set_key(key, image)
+            return self._system.set_key(key, image, force)
         return False
 
-    def setup_key(self, key: int, *, down: Callable | None = None, up: Callable | None = None) -> bool:
+    def set_keys(self, images: dict[int, Image.Image | DeviceImage], force: bool = False) -> dict[int, bool]:
+        if not self._check_system():
+            return {key: False for key in images}
+
+        results = {key: False for key in images}
+        results.update(
+            self._system.set_keys(
+                {key: image for key, image in images.items() if 0 < key < self._system.get_key_count()}, force
+            )
+        )
+        return results
+
+    def animate_key(self, key: int, animation: Animation) -> bool:
+        """
+        Plays an animation on a key until it ends, is stopped or the app is closed
+        """
+        if not self._check_system():
+            return False
+
+        if 0 < key < self._system.get_key_count():
+            self._system.get_animator().play(key, animation)
+            return True
+        return False
+
+    def stop_animation(self, key: int | None = None) -> None:
+        if self._check_system():
+            self._system.get_animator().stop(key)
+
+    def prepare_image(
+        self, image: Image.Image, encode: bool = False, quality: EncodeQuality = EncodeQuality.FULL
+    ) -> DeviceImage | Image.Image:
+        """
+        Prepares an image for the deck the app is running on, see SDSystem.prepare_image
+        """
+        if not self._check_system():
+            return image
+        return self._system.prepare_image(image, encode, quality)
+
+    def set_key_quality(self, key: int, quality: EncodeQuality) -> None:
+        if self._check_system():
+            self._system.set_key_quality(key, quality)
+
+    @contextmanager
+    def frame(self) -> Generator[None, None, None]:
+        if not self._check_system():
+            yield
+            return
+        with self._system.frame():
+            yield
+
+    def setup_key(
+        self,
+        key: int,
+        *,
+        down: Callable | None = None,
+        up: Callable | None = None,
+        threaded: bool | None = None,
+    ) -> bool:
+        """
+        Registers key callbacks. Synchronous callbacks run on a bounded thread pool if threaded is set,
+        by default the app's _THREADED_CALLBACKS decides. Threaded callbacks must not use the event loop.
+        """
         if not self._check_system():
             return False
+        threaded = self._THREADED_CALLBACKS if threaded is None else threaded
         if up:
-            self._key_up_callbacks[key].append(up)
+            self._key_up_callbacks[key].append((up, self._callback_kind(up, threaded)))
         if down:
-            self._key_down_callbacks[key].append(down)
+            self._key_down_callbacks[key].append((down, self._callback_kind(down, threaded)))
         return True
 
+    @staticmethod
+    def _callback_kind(callback: Callable, threaded: bool) -> _CallbackKind:
+        if inspect.iscoroutinefunction(callback):
+            return _CallbackKind.COROUTINE
+        return _CallbackKind.THREADED if threaded else _CallbackKind.SYNC
+
     def clear_key_event(self, key: int) -> bool:
         if not self._check_system():
             return False
@@ -209,30 +803,55 @@ class _SDApp(ABC):
     def start(self, system: SDSystem) -> None:
         self._running = True
         self._system = system
-        self.init()
-
-    def key_event(self, keys_before: list[bool], keys: list[bool]):
-        self.keys_update(keys_before, keys)
-        loop = asyncio.get_event_loop()
-        for key, (before, after) in enumerate(zip(keys_before, keys)):
-            if before and not after:
-                for callback in self._key_up_callbacks[key]:
-                    try:
-                        if inspect.iscoroutinefunction(callback):
-                            loop.create_task(callback())
-                        else:
-                            callback()
-                    except Exception as e:
-                        logging.error(f"Error in key up callback for key {key}: {e}")
-            elif not before and after:
-                for callback in self._key_down_callbacks[key]:
-                    try:
-                        if inspect.iscoroutinefunction(callback):
-                            loop.create_task(callback())
-                        else:
-                            callback()
-                    except Exception as e:
-                        logging.error(f"Error in key up callback for key {key}: {e}")
+        self._await_result(self.init())
+
+    def spawn(self, coroutine: Coroutine) -> asyncio.Task:
+        """
+        Runs a coroutine as a task of this app, it is cancelled when the app is closed
+        """
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(_report_task_result)
+        return task
+
+    def _await_result(self, result: Awaitable | None) -> None:
+        # hooks may be implemented as coroutines, they run as tasks of the app
+        if inspect.iscoroutine(result):
+            self.spawn(result)
+
+    def key_event(self, pressed: int, released: int):
+        self._await_result(self.keys_changed(pressed, released))
+        if self._wants_key_lists and self._system:
+            keys = self._system.get_key_mask()
+            key_count = self._system.get_key_count()
+            self._await_result(
+                self.keys_update(
+                    mask_to_keys((keys & ~pressed) | released, key_count),
+                    mask_to_keys(keys, key_count),
+                )
+            )
+        for key in iter_mask_keys(pressed | released):
+            if released >> key & 1:
+                callbacks = self._key_up_callbacks.get(key, ())
+                kind = "up"
+            else:
+                callbacks = self._key_down_callbacks.get(key, ())
+                kind = "down"
+            for callback, callback_kind in callbacks:
+                try:
+                    if callback_kind == _CallbackKind.COROUTINE:
+                        self.spawn(callback())
+                    elif callback_kind == _CallbackKind.THREADED:
+                        self._system.get_callback_executor().submit(self, key, callback)
+                    elif metrics.enabled:
+                        start = time.perf_counter()
+                        self._await_result(callback())
+                        metrics.observe("key_callback", time.perf_counter() - start)
+                    else:
+                        self._await_result(callback())
+                except Exception as e:
+                    logging.error(f"Error in key {kind} callback for key {key}: {e}")
 
     def close_app(self):
         self._system.close_app()
@@ -245,23 +864,50 @@ class _SDApp(ABC):
 
     def stop(self) -> None:
         self._running = False
-        self.on_close()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        if self._system and self._system._callback_executor:
+            self._system._callback_executor.cancel(self)
+        result = self.on_close()
+        if not inspect.iscoroutine(result):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # the system is shut down after its event loop ended
+            asyncio.run(result)
+            return
+        # the app's own tasks are cancelled already, so on_close runs on its own
+        task = loop.create_task(result)
+        _closing_tasks.add(task)
+        task.add_done_callback(_closing_tasks.discard)
+        task.add_done_callback(_report_task_result)
 
     def closed(self) -> None:
         self._system = None
 
-    def init(self) -> None:
+    def init(self) -> None | Awaitable[None]:
+        """
+        Called when the app is started, may be implemented as a coroutine
+        """
         self.clear_key_callbacks()
 
-    def keys_update(self, keys_before: list[bool], keys: list[bool]) -> None: ...
+    def keys_changed(self, pressed: int, released: int) -> None | Awaitable[None]:
+        """
+        Called with the bitmasks of pressed and released keys whenever the key states change
+        """
 
-    def on_close(self) -> None: ...
+    def keys_update(self, keys_before: list[bool], keys: list[bool]) -> None | Awaitable[None]: ...
+
+    def on_close(self) -> None | Awaitable[None]: ...
 
 
 class SDUserApp(_SDApp, ABC):
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str, app_id: str | None = None) -> None:
         super().__init__()
         self._name = name
+        self._app_id = app_id
 
     def get_usable_keys(self) -> range:
         return range(1, self._system.get_key_count())
@@ -269,6 +915,18 @@ class SDUserApp(_SDApp, ABC):
     def get_name(self) -> str:
         return self._name
 
+    def get_id(self) -> str:
+        """
+        Identifies the app for SDSystem.launch_app, defaults to the app's name
+        """
+        return self._app_id if self._app_id is not None else self._name
+
+    def has_app_id(self) -> bool:
+        """
+        True if an app_id was passed, those must be unique while apps identified by their name may share it
+        """
+        return self._app_id is not None
+
     @abstractmethod
     def get_icon(self) -> Image.Image: ...
 
@@ -286,49 +944,100 @@ class SDUserApp(_SDApp, ABC):
         font_size: int = 14,
         background: str | None = "#00000080",
     ) -> Image.Image:
+        """
+        Draws a label onto a copy of base. Labels are memoized, every caller gets its own copy to draw on.
+        """
+        return SDUserApp._labeled_img(base, image_digest(base), label, position, color, font_size, background).copy()
+
+    @staticmethod
+    def generate_labeled_imgs(
+        base: Image.Image | dict[Any, Image.Image],
+        labels: dict[Any, str],
+        position: tuple[int, int] = (36, 52),
+        color: tuple[int, int, int] = (255, 255, 255),
+        font_size: int = 14,
+        background: str | None = "#00000080",
+    ) -> dict[Any, Image.Image]:
+        """
+        Labels a whole row or page of keys in one call, base is either shared by all labels or given per key
+        """
+        digests: dict[int, bytes] = {}
+        labeled_imgs = {}
+        for key, label in labels.items():
+            key_base = base[key] if isinstance(base, dict) else base
+            digest = digests.get(id(key_base))
+            if digest is None:
+                digest = digests[id(key_base)] = image_digest(key_base)
+            labeled_img = SDUserApp._labeled_img(key_base, digest, label, position, color, font_size, background)
+            labeled_imgs[key] = labeled_img.copy()
+        return labeled_imgs
+
+    @staticmethod
+    def _labeled_img(
+        base: Image.Image,
+        digest: bytes,
+        label: str,
+        position: tuple[int, int],
+        color: tuple[int, int, int],
+        font_size: int,
+        background: str | None,
+    ) -> Image.Image:
+        cache_key = (digest, label, tuple(position), tuple(color), font_size, background)
+        with _labeled_imgs_lock:
+            labeled_img = _labeled_imgs.get(cache_key)
+            if labeled_img is not None:
+                _labeled_imgs.move_to_end(cache_key)
+                return labeled_img
+
         labeled_img = base.copy()
-        draw = ImageDraw.Draw(labeled_img)
-        text_pos = position
-        if background is not None:
-            bbox = draw.textbbox(
-                text_pos,
-                label,
-                font=SDUserApp.font(font_size),
-                anchor="mm",
-                align="center",
-            )
-            draw.rectangle(bbox, fill=background)
-        draw.text(
-            text_pos,
-            label,
-            color,
-            font=SDUserApp.font(font_size),
-            anchor="mm",
-            align="center",
-        )
+        # glyphs come from a per font atlas, the output is identical to drawing the text with Pillow
+        draw_label(labeled_img, label, position, color, SDUserApp.font(font_size), background)
 
+        with _labeled_imgs_lock:
+            _labeled_imgs[cache_key] = labeled_img
+            while len(_labeled_imgs) > _LABELED_IMG_CACHE_SIZE:
+                _labeled_imgs.popitem(last=False)
         return labeled_img
 
 
 class _SDSystemApp(_SDApp, ABC):
-    def set_key(self, key: int, image: Image.Image):
-        return self._system.set_key(key, image)
+    def set_key(self, key: int, image: Image.Image | DeviceImage, force: bool = False):
+        return self._system.set_key(key, image, force)
+
+    def set_keys(self, images: dict[int, Image.Image | DeviceImage], force: bool = False) -> dict[int, bool]:
+        return self._system.set_keys(images, force)
 
 
 class _LaunchPad(_SDSystemApp):
     def __init__(self) -> None:
         super().__init__()
         self.apps: dict[int, SDUserApp] = {}
+        self._page = 0
+        self._page_count = 1
 
     def init(self) -> None:
-        self.apps.clear()
-        for key, app in enumerate(self._system.get_apps()[: self._system.get_key_count()]):
-            self.set_key(key, app.get_icon())
-            self.apps[key] = app
-
-    def keys_update(self, keys_before: list[bool], keys: list[bool]) -> None:
-        for key, (before, after) in enumerate(zip(keys_before, keys)):
-            if before and not after and key < len(self.apps):
+        # returning to the launchpad shows the page it was left on
+        self._show_page(self._system._launchpad_page)
+
+    def _show_page(self, page: int) -> None:
+        pages = self._system.get_launchpad_pages()
+        self._page_count = len(pages)
+        self._page = page % self._page_count
+        self._system._launchpad_page = self._page
+        self.apps = dict(enumerate(pages[self._page]))
+        images = dict.fromkeys(range(self._system.get_key_count()), Sprites.CLEAR)
+        images.update(self._system._launchpad_page_images(self._page))
+        self.set_keys(images)
+        if self._page_count > 1:
+            self._system._prefetch_launchpad_page((self._page + 1) % self._page_count)
+
+    def keys_changed(self, pressed: int, released: int) -> None:
+        key_count = self._system.get_key_count()
+        for key in iter_mask_keys(released):
+            if self._page_count > 1 and key >= key_count - 2:
+                self._show_page(self._page + (1 if key == key_count - 1 else -1))
+                break
+            if key in self.apps:
                 self._system._start_app(self.apps[key])
                 self.stop()
                 break
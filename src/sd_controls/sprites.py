@@ -6,7 +6,24 @@ _LIB_PATH = Path(__file__).parent
 _IMG_PATH = _LIB_PATH / "imgs"
 
 
+class _Sprite:
+    """
+    Loads and decodes its image on first access instead of when sd_controls is imported
+    """
+
+    def __init__(self, file_name: str) -> None:
+        self._path = _IMG_PATH / file_name
+        self._image: Image.Image | None = None
+
+    def __get__(self, instance: object, owner: type) -> Image.Image:
+        if self._image is None:
+            image = Image.open(self._path)
+            image.load()
+            self._image = image
+        return self._image
+
+
 class Sprites:
-    CLEAR = Image.open(_IMG_PATH / "clear.jpeg")
-    BACK_BTN = Image.open(_IMG_PATH / "back_btn.jpeg")
-    GOAT = Image.open(_IMG_PATH / "goat.jpeg")
+    CLEAR = _Sprite("clear.jpeg")
+    BACK_BTN = _Sprite("back_btn.jpeg")
+    GOAT = _Sprite("goat.jpeg")
@@ -1,21 +1,79 @@
 import asyncio
-import io
+import hashlib
+import time
 from abc import ABC, abstractmethod
-from typing import Callable
+from concurrent.futures import Future
+from enum import Enum
+from io import BytesIO
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator
 
-import hid
 from PIL import Image
 
+from sd_controls.deviceimage import DeviceImage
+from sd_controls.encoder import DEFAULT_TARGET_PACKETS, BmpEncoder, EncodeQuality, JpegEncoder
+from sd_controls.framecache import FrameCache, image_digest
+from sd_controls.hiderrors import hid_exception
+from sd_controls.metrics import metrics
+from sd_controls.profiles import STREAMDECK_MK2, DeviceProfile, HeaderField
+from sd_controls.writer import KeyImageWriter
+
+if TYPE_CHECKING:
+    import hid
+
+    from sd_controls.recorder import SessionRecorder
+
+# shared between all hardware decks, entries are keyed by device model and key
+_SHARED_FRAME_CACHE = FrameCache()
+
+
+class ReadMode(Enum):
+    # _get_data is polled from the event loop with a short read timeout
+    POLLING = 1
+    # a background thread blocks on the device and hands reports to the event loop
+    THREAD = 2
+
+
+def keys_to_mask(keys: list[bool]) -> int:
+    mask = 0
+    for key, pressed in enumerate(keys):
+        if pressed:
+            mask |= 1 << key
+    return mask
+
+
+def mask_to_keys(mask: int, key_count: int) -> list[bool]:
+    return [bool(mask >> key & 1) for key in range(key_count)]
+
+
+def iter_mask_keys(mask: int) -> Iterator[int]:
+    """
+    Yields the indices of all set bits in ascending order
+    """
+    while mask:
+        bit = mask & -mask
+        yield bit.bit_length() - 1
+        mask ^= bit
+
+
+# receives the deck, the mask of newly pressed keys and the mask of released keys
+KeyListener = Callable[["StreamDeck", int, int], None]
+
 
 class StreamDeck(ABC):
     _ICON_SIZE: int = 0
     _KEY_COUNT: int = 0
+    # rotation in degrees (as passed to Image.rotate) for an image to appear upright on the device
+    _IMAGE_ROTATION: int = 0
 
     def __init__(self) -> None:
-        self._event_listeners: list[Callable[["StreamDeck", list[bool], list[bool]], None]] = []
-        self._keys: list[bool] = [False] * self._KEY_COUNT
+        self._key_listeners: list[KeyListener] = []
+        self._key_mask = 0
         self._running = False
+        self._connected = True
         self._brightness = 100
+        self._key_quality: dict[int, EncodeQuality] = {}
+        self._recorder: "SessionRecorder | None" = None
 
     def set_brightness(self, percentage: int) -> None:
         self._brightness = percentage
@@ -32,155 +90,438 @@ class StreamDeck(ABC):
     def get_key_count(self) -> int:
         return self._KEY_COUNT
 
+    def get_icon_size(self) -> int:
+        return self._ICON_SIZE
+
+    def get_image_rotation(self) -> int:
+        return self._IMAGE_ROTATION
+
+    def set_key_quality(self, key: int, quality: EncodeQuality) -> None:
+        """
+        Trades image quality for fewer packets on a key, e.g. EncodeQuality.FAST for keys that change often
+        """
+        self._key_quality[key] = quality
+
+    def get_key_quality(self, key: int) -> EncodeQuality:
+        return self._key_quality.get(key, EncodeQuality.FULL)
+
+    def encode_image(self, image: Image.Image, quality: EncodeQuality = EncodeQuality.FULL) -> bytes | None:
+        """
+        Converts an image into the device's wire format, decks without one return None
+        """
+        return None
+
+    def set_recorder(self, recorder: "SessionRecorder | None") -> None:
+        """
+        Records key input and image writes of this deck, None stops recording
+        """
+        self._recorder = recorder
+
+    def get_recorder(self) -> "SessionRecorder | None":
+        return self._recorder
+
     def get_keys(self) -> list[bool]:
-        return self._keys
+        return mask_to_keys(self._key_mask, self.get_key_count())
+
+    def get_key_mask(self) -> int:
+        return self._key_mask
 
     async def run(self) -> None:
         self._running = True
         try:
-            while self._running:
-                data = self._get_data()
-                if data is None:
-                    await asyncio.sleep(0)
-                    continue
-
-                keys_before = self._keys.copy()
-                self._keys = data
-                for listener in self._event_listeners:
-                    listener(self, keys_before, self._keys.copy())
+            async for key_mask in self._reports():
+                # unchanged reports reach no listener, but the loop still yields to other tasks
+                if key_mask != self._key_mask:
+                    self._keys_changed(key_mask)
                 await asyncio.sleep(0)
-        except (KeyboardInterrupt, hid.HIDException):
+        except KeyboardInterrupt:
             self._running = False
+        except hid_exception():
+            self._running = False
+            self._connected = False
+
+    def _keys_changed(self, key_mask: int) -> None:
+        keys_before = self._key_mask
+        self._key_mask = key_mask
+        if self._recorder is not None:
+            self._recorder.record_input(key_mask)
+        pressed = key_mask & ~keys_before
+        released = keys_before & ~key_mask
+        if metrics.enabled:
+            for listener in self._key_listeners:
+                start = time.perf_counter()
+                listener(self, pressed, released)
+                metrics.observe("key_listener", time.perf_counter() - start)
+        else:
+            for listener in self._key_listeners:
+                listener(self, pressed, released)
+
+    def is_connected(self) -> bool:
+        """
+        False once reading from the device failed, e.g. because it was unplugged
+        """
+        return self._connected
+
+    async def _reports(self) -> AsyncIterator[int]:
+        while self._running:
+            data = self._get_data()
+            if data is None:
+                await asyncio.sleep(0)
+                continue
+            yield data
 
     def stop(self) -> None:
         self._running = False
 
+    def add_key_listener(self, callback: KeyListener) -> None:
+        """
+        Registers a listener which is called with the masks of pressed and released keys whenever they change
+        """
+        self._key_listeners.append(callback)
+
     def add_event_listener(self, callback: Callable[["StreamDeck", list[bool], list[bool]], None]) -> None:
-        self._event_listeners.append(callback)
+        """
+        Registers a listener which is called with the full key states before and after every change
+        """
+
+        def listener(deck: StreamDeck, pressed: int, released: int) -> None:
+            keys_before = (deck._key_mask & ~pressed) | released
+            key_count = deck.get_key_count()
+            callback(deck, mask_to_keys(keys_before, key_count), mask_to_keys(deck._key_mask, key_count))
+
+        self._key_listeners.append(listener)
 
     def clear_event_listeners(self) -> None:
-        self._event_listeners.clear()
+        self._key_listeners.clear()
 
     @abstractmethod
-    def set_key_image(self, key: int, image: Image.Image) -> bool: ...
+    def set_key_image(self, key: int, image: Image.Image | DeviceImage) -> bool | Future: ...
+
+    def set_key_images(self, images: dict[int, Image.Image | DeviceImage]) -> dict[int, bool | Future]:
+        return {key: self.set_key_image(key, image) for key, image in sorted(images.items())}
 
     @abstractmethod
-    def _get_data(self) -> list[bool] | None: ...
+    def _get_data(self) -> int | None: ...
 
 
 class HardwareStreamDeck(StreamDeck):
-    _PID: int = 0
-    _ICON_SIZE: int = 0
-    _KEY_DATA_OFFSET: int = 0
-    _IMAGE_CMD_HEADER_LENGTH: int = 0
-    _IMAGE_CMD_MAX_PAYLOAD_LENGTH: int = 0
-
-    def __init__(self, device: hid.Device, read_interval: int = 1, buffer_size: int = 1024) -> None:
+    """
+    Drives any Stream Deck model described by a DeviceProfile (sd_controls.profiles)
+    """
+
+    # packets a key image may span per EncodeQuality
+    _JPEG_TARGET_PACKETS: dict[EncodeQuality, int] = DEFAULT_TARGET_PACKETS
+
+    def __init__(
+        self,
+        device: "hid.Device",
+        profile: DeviceProfile,
+        read_interval: int = 1,
+        buffer_size: int | None = None,
+        frame_cache: FrameCache | None = None,
+        write_thread: bool = False,
+        read_mode: ReadMode = ReadMode.POLLING,
+        read_timeout: int | None = 500,
+        encoder: JpegEncoder | BmpEncoder | None = None,
+    ) -> None:
         super().__init__()
         self._device = device
+        self._profile = profile
         self._read_interval = read_interval
-        self._buffer_size = buffer_size
+        self._buffer_size = buffer_size or profile.input_report_length
+        self._key_data_start = profile.key_data_offset
+        self._key_data_end = profile.key_data_offset + profile.key_count
+        self._image_header = profile.image_header
+        self._read_mode = read_mode
+        # only used by ReadMode.THREAD, None blocks until the next report arrives
+        self._read_timeout = read_timeout
+        # event loop, report queue and stop event of the running reader thread
+        self._reader: tuple[asyncio.AbstractEventLoop, asyncio.Queue, Event] | None = None
+        # the last parsed report, repeated reports are not parsed again
+        self._last_key_data = b""
+        self._last_key_mask = 0
+        self._frame_cache = frame_cache if frame_cache is not None else _SHARED_FRAME_CACHE
+        self._write_lock = Lock()
+        self._writer = KeyImageWriter(self._send_key_image) if write_thread else None
+        self._encoder = encoder or profile.create_encoder(self._JPEG_TARGET_PACKETS)
 
     def __str__(self) -> str:
         return f"{self._device.product} ({self._device.manufacturer})"
 
-    @abstractmethod
+    def get_profile(self) -> DeviceProfile:
+        return self._profile
+
+    def get_key_count(self) -> int:
+        return self._profile.key_count
+
+    def get_icon_size(self) -> int:
+        return self._profile.icon_size
+
+    def get_image_rotation(self) -> int:
+        return self._profile.image_rotation
+
+    def set_brightness(self, percentage: int) -> None:
+        super().set_brightness(percentage)
+        with self._write_lock:
+            self._device.send_feature_report(self._profile.brightness_report(percentage))
+
+    def set_standby_timeout(self, timeout_secs: int) -> None:
+        super().set_standby_timeout(timeout_secs)
+        report = self._profile.timeout_report(timeout_secs)
+        if report is None:
+            return
+        with self._write_lock:
+            self._device.send_feature_report(report)
+
     def _get_send_image_command_header(
         self, key: int, is_last_package: bool, payload_length: int, package_index: int
-    ) -> bytes: ...
+    ) -> bytes:
+        return self._image_header.pack(key, is_last_package, payload_length, package_index)
+
+    def stop(self) -> None:
+        super().stop()
+        # run() returns right away, a reader blocked on the device drops its next report and exits
+        reader = self._reader
+        if reader is not None:
+            self._reader = None
+            loop, queue, stopped = reader
+            stopped.set()
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+            except RuntimeError:
+                # the event loop is already closed
+                pass
+        if self._writer:
+            self._writer.close()
+            self._writer = None
 
     def __del__(self):
         print("Close device")
+        if self._writer:
+            self._writer.close()
         if self._device:
             self._device.close()
 
-    def _get_data(self) -> list[bool] | None:
-        data = self._device.read(self._buffer_size, self._read_interval)
+    def _parse_keys(self, data: bytes) -> int:
+        key_data = data[self._key_data_start : self._key_data_end]
+        if key_data != self._last_key_data:
+            mask = 0
+            for key, pressed in enumerate(key_data):
+                if pressed:
+                    mask |= 1 << key
+            self._last_key_data = key_data
+            self._last_key_mask = mask
+        return self._last_key_mask
+
+    def _read_report(self, timeout: int | None) -> bytes:
+        if not metrics.enabled:
+            return self._device.read(self._buffer_size, timeout)
+        start = time.perf_counter()
+        data = self._device.read(self._buffer_size, timeout)
         if len(data) > 0:
-            return [bool(k) for k in data[self._KEY_DATA_OFFSET : self._KEY_DATA_OFFSET + self._KEY_COUNT]]
-        return None
+            metrics.observe("hid_read", time.perf_counter() - start)
+            metrics.increment("hid_reports")
+        return data
 
-    def set_key_image(self, key: int, image: Image.Image) -> bool:
-        max_payload_length = self._IMAGE_CMD_MAX_PAYLOAD_LENGTH
+    def _get_data(self) -> int | None:
+        data = self._read_report(self._read_interval)
+        if len(data) > 0:
+            return self._parse_keys(data)
+        return None
 
-        img_byte_buffer = io.BytesIO()
-        image.save(img_byte_buffer, format="JPEG")
-        img_bytes = img_byte_buffer.getvalue()
+    async def _reports(self) -> AsyncIterator[int]:
+        if self._read_mode != ReadMode.THREAD:
+            async for data in super()._reports():
+                yield data
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = Event()
+        self._reader = (loop, queue, stopped)
+        reader = Thread(target=self._read_reports, args=(loop, queue, stopped), name="sd-controls-reader", daemon=True)
+        reader.start()
+        try:
+            while self._running:
+                data = await queue.get()
+                if data is None:
+                    break
+                if isinstance(data, Exception):
+                    raise data
+                yield data
+        finally:
+            self._running = False
+            stopped.set()
+            self._reader = None
 
-        package = 0
-        offset = 0
-        remaining_data = len(img_bytes)
-        # print("Total length", remaining_data)
+    def _read_reports(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, stopped: Event) -> None:
+        result = None
+        last_mask = self._key_mask
+        try:
+            while self._running and not stopped.is_set():
+                data = self._read_report(self._read_timeout)
+                if len(data) == 0:
+                    continue
+                key_mask = self._parse_keys(data)
+                # unchanged reports never wake up the event loop
+                if key_mask != last_mask:
+                    last_mask = key_mask
+                    loop.call_soon_threadsafe(queue.put_nowait, key_mask)
+        except hid_exception() as e:
+            result = e
         try:
-            while remaining_data > 0:
-                payload_length = min(max_payload_length, remaining_data)
-                remaining_data -= payload_length
-
-                header = self._get_send_image_command_header(
-                    key,
-                    remaining_data == 0,
-                    payload_length,
-                    package,
-                )
-                data = (
-                    header
-                    + img_bytes[offset : offset + payload_length]
-                    + bytes([0x0] * (max_payload_length - payload_length))
-                )
-
-                self._device.write(data)
-                # print(
-                #    "Wrote package", package, "Header:", header, "Data-Length:", len(data)
-                # )
-
-                offset += payload_length
-                package += 1
-        except hid.HIDException:
-            return False
-        return True
+            loop.call_soon_threadsafe(queue.put_nowait, result)
+        except RuntimeError:
+            # the event loop is already closed
+            pass
+
+    def get_frame_cache(self) -> FrameCache:
+        return self._frame_cache
+
+    def get_encoder(self) -> JpegEncoder | BmpEncoder:
+        return self._encoder
+
+    def encode_image(self, image: Image.Image, quality: EncodeQuality = EncodeQuality.FULL) -> bytes:
+        start = time.perf_counter() if metrics.enabled else 0.0
+        if self._profile.image_transpose is not None:
+            image = image.transpose(self._profile.image_transpose)
+        img_bytes = self._encoder.encode(image, quality)
+        if metrics.enabled:
+            metrics.observe("jpeg_encode", time.perf_counter() - start)
+            metrics.increment("jpeg_images")
+            metrics.increment("jpeg_bytes", len(img_bytes))
+            metrics.increment("jpeg_packets", self._encoder.packet_count(len(img_bytes)))
+        return img_bytes
+
+    def _build_packets(self, key: int, img_bytes: bytes) -> tuple[bytes, ...]:
+        return self._profile.build_image_reports(key, img_bytes)
+
+    def adopt_packets(self, key: int, packets: tuple[bytes, ...], rotation: int) -> DeviceImage:
+        """
+        Wraps reports that were packetized elsewhere, e.g. by a remote client, into an image for key.
+        The reports are placed in the frame cache so they are written verbatim, the pixels are only decoded
+        if something else needs them. Raises ValueError unless the reports are exactly the image reports
+        this deck would send for key.
+        """
+        header = self._image_header
+        report_length = self._profile.image_report_length
+        max_payload_length = self._profile.image_payload_length
+        if not packets or any(len(packet) != report_length for packet in packets):
+            raise ValueError(f"Packets for {self} must be {report_length} bytes long")
+        digest = hashlib.blake2b(digest_size=16)
+        payloads = []
+        for index, packet in enumerate(packets):
+            is_last = index == len(packets) - 1
+            # headers without a length field carry a full payload, the padding of the last one is ignored
+            payload_length = header.unpack_from(packet).get(HeaderField.PAYLOAD_LENGTH, max_payload_length)
+            if (
+                not 0 < payload_length <= max_payload_length
+                or (not is_last and payload_length != max_payload_length)
+                or packet[: header.length] != header.pack(key, is_last, payload_length, index)
+            ):
+                raise ValueError(f"Packet {index} is not image report {index} of {len(packets)} for key {key}")
+            digest.update(packet)
+            payloads.append(packet[header.length : header.length + payload_length])
+        frame_digest = digest.digest()
+        encoded = b"".join(payloads)
+        image = Image.open(BytesIO(encoded))
+        self._frame_cache.put((frame_digest, self._profile.product_id, key, self.get_key_quality(key)), tuple(packets))
+        return DeviceImage(image, rotation, frame_digest, frame_digest, encoded)
+
+    def _packetize(self, key: int, image: Image.Image | DeviceImage) -> tuple[bytes, ...]:
+        # the image is already rotated for the orientation, so its content hash covers it
+        quality = self.get_key_quality(key)
+        if isinstance(image, DeviceImage):
+            cache_key = (image.frame_digest, self._profile.product_id, key, quality)
+        else:
+            cache_key = (image_digest(image), self._profile.product_id, key, quality)
+        packets = self._frame_cache.get(cache_key)
+        if packets is None:
+            if isinstance(image, DeviceImage):
+                # pre-encoded images keep the quality they were prepared with
+                encoded = image.encoded if image.encoded is not None else self.encode_image(image.image, quality)
+            else:
+                encoded = self.encode_image(image, quality)
+            packets = self._build_packets(key, encoded)
+            self._frame_cache.put(cache_key, packets)
+        return packets
+
+    def _write_packets(self, key: int, packets: tuple[bytes, ...]) -> bool:
+        return self._write_key_packets({key: packets})[key]
+
+    def _write_key_packets(self, packets: dict[int, tuple[bytes, ...]]) -> dict[int, bool]:
+        """
+        Writes the packets of several keys in one burst, keys after a failed write are reported as failed
+        """
+        start = time.perf_counter() if metrics.enabled else 0.0
+        results = dict.fromkeys(packets, False)
+        recorder = self._recorder
+        key_start = 0.0
+        try:
+            with self._write_lock:
+                write = self._device.write
+                for key, key_packets in packets.items():
+                    if recorder is not None:
+                        key_start = time.perf_counter()
+                    for packet in key_packets:
+                        write(packet)
+                    results[key] = True
+                    if recorder is not None:
+                        recorder.record_image(key, key_packets, time.perf_counter() - key_start, True)
+        except hid_exception():
+            if recorder is not None:
+                recorder.record_image(key, packets[key], time.perf_counter() - key_start, False)
+            return results
+        if metrics.enabled:
+            metrics.observe("hid_write", time.perf_counter() - start)
+            for key_packets in packets.values():
+                metrics.increment("hid_packets_written", len(key_packets))
+                metrics.increment("hid_bytes_written", sum(len(packet) for packet in key_packets))
+        return results
+
+    def _send_key_image(self, key: int, image: Image.Image | DeviceImage) -> bool:
+        return self._write_packets(key, self._packetize(key, image))
+
+    def set_key_image(self, key: int, image: Image.Image | DeviceImage) -> bool | Future:
+        """
+        Sends an image to a key. With a write thread the image is queued and a future of the result is returned.
+        """
+        if self._writer:
+            return self._writer.submit(key, image)
+        return self._send_key_image(key, image)
+
+    def set_key_images(self, images: dict[int, Image.Image | DeviceImage]) -> dict[int, bool | Future]:
+        if self._writer:
+            return self._writer.submit_many(dict(sorted(images.items())))
+        # encode everything first so the writes go out in one uninterrupted burst
+        packets = {key: self._packetize(key, image) for key, image in sorted(images.items())}
+        return self._write_key_packets(packets)
 
 
 class StreamDeckMk2(HardwareStreamDeck):
-    _PID: int = 0x0080
-    _ICON_SIZE: int = 70
-    _KEY_COUNT: int = 15
-    _KEY_DATA_OFFSET: int = 4
-    _IMAGE_CMD_HEADER_LENGTH: int = 8
-    _IMAGE_CMD_MAX_PAYLOAD_LENGTH: int = 1016
-
-    def __init__(self, device: hid.Device, read_interval: int = 1, buffer_size: int = 512) -> None:
-        super().__init__(device, read_interval, buffer_size)
-
-    def set_brightness(self, percentage: int) -> None:
-        super().set_brightness(percentage)
-        # command 0x03 0x08 (percentage as byte) ...
-        command = bytes([0x03, 0x08, percentage] + [0x0] * 29)
-        self._device.send_feature_report(command)
-
-    def set_standby_timeout(self, timeout_secs: int) -> None:
-        super().set_standby_timeout(timeout_secs)
-        command = bytes(
-            [
-                0x03,
-                0x0D,
-                timeout_secs & 0xFF,
-                timeout_secs >> 8,
-            ]
-        )
-        self._device.send_feature_report(command)
-
-    def _get_send_image_command_header(
-        self, key: int, is_last_package: bool, payload_length: int, package_index: int
-    ) -> bytes:
-        return bytes(
-            [
-                0x02,
-                0x07,
-                key,
-                is_last_package,
-                payload_length & 0xFF,
-                payload_length >> 8,
-                package_index & 0xFF,
-                package_index >> 8,
-            ]
+    """
+    A Stream Deck Mk.2, the same as HardwareStreamDeck(device, STREAMDECK_MK2)
+    """
+
+    def __init__(
+        self,
+        device: "hid.Device",
+        read_interval: int = 1,
+        buffer_size: int | None = None,
+        frame_cache: FrameCache | None = None,
+        write_thread: bool = False,
+        read_mode: ReadMode = ReadMode.POLLING,
+        read_timeout: int | None = 500,
+        encoder: JpegEncoder | None = None,
+    ) -> None:
+        super().__init__(
+            device,
+            STREAMDECK_MK2,
+            read_interval,
+            buffer_size,
+            frame_cache,
+            write_thread,
+            read_mode,
+            read_timeout,
+            encoder,
         )
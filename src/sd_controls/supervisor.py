@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Callable
+
+from sd_controls.sdsystem import NoStreamDeckFoundExcpetion, Orientation, SDSystem
+from sd_controls.streamdeck import ReadMode, StreamDeck
+
+if TYPE_CHECKING:
+    from sd_controls.renderpool import RenderPool
+
+
+class SDSupervisor:
+    """
+    Runs several Stream Decks on a single event loop, each with its own SDSystem.
+    setup is called for every new system and is the place to register its apps.
+    A render_pool is shared by all systems, it is not closed with the supervisor.
+    """
+
+    def __init__(
+        self,
+        setup: Callable[[SDSystem], None] | None = None,
+        orientation: Orientation = Orientation.DEFAULT,
+        timeout: int = 0,
+        render_pool: "RenderPool | None" = None,
+    ) -> None:
+        self._setup = setup
+        self._orientation = orientation
+        self._timeout = timeout
+        self._render_pool = render_pool
+        self._systems: list[SDSystem] = []
+
+    def add_deck(self, deck: StreamDeck, orientation: Orientation | None = None) -> SDSystem:
+        system = SDSystem(
+            orientation=orientation or self._orientation,
+            timeout=self._timeout,
+            deck=deck,
+            render_pool=self._render_pool,
+        )
+        if self._setup:
+            self._setup(system)
+        self._systems.append(system)
+        return system
+
+    def get_systems(self) -> list[SDSystem]:
+        return self._systems
+
+    def connect_all(self) -> list[SDSystem]:
+        """
+        Adds every connected Stream Deck. Reads and writes run on per-deck threads,
+        so a slow image upload on one deck never delays the key events of another.
+        """
+        decks = SDSystem.find_streamdecks(read_mode=ReadMode.THREAD, write_thread=True)
+        if len(decks) == 0:
+            raise NoStreamDeckFoundExcpetion("There is no streamdeck available")
+        return [self.add_deck(deck) for deck in decks]
+
+    async def run(self) -> None:
+        await asyncio.gather(*(self._run_system(system) for system in self._systems))
+
+    async def _run_system(self, system: SDSystem) -> None:
+        # a deck that fails is logged and closed, the other decks keep running
+        try:
+            await system.run()
+        except Exception as e:
+            logging.error(f"Stream Deck {system.get_deck()} stopped with an error: {e}")
+            if system in self._systems:
+                self._systems.remove(system)
+            try:
+                system.close()
+            except Exception as e:
+                logging.error(f"Error while closing Stream Deck {system.get_deck()}: {e}")
+
+    def start(self) -> None:
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            self.close()
+            print("Stream Deck Supervisor shutdown")
+
+    def close(self) -> None:
+        for system in self._systems:
+            system.close()
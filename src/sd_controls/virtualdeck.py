@@ -1,26 +1,45 @@
-import tkinter as tk
+import asyncio
 
 from PIL import Image
-from PIL import ImageTk as itk
 
-from typing import Callable
+from typing import AsyncIterator, Callable
 
+from sd_controls.deviceimage import DeviceImage
+from sd_controls.lazyimport import lazy_import
 from sd_controls.sprites import Sprites
 from sd_controls.streamdeck import StreamDeck
 
+# Tk is only loaded once a virtual deck is created
+tk = lazy_import("tkinter")
+itk = lazy_import("PIL.ImageTk")
+
 
 class VirtualDeckMk2(StreamDeck):
-    _ICON_SIZE: int = 70
+    """
+    A Stream Deck Mk.2 in a Tk window. Only keys whose image changed are redrawn, the Tk event loop is pumped
+    every pump_interval seconds. With canvas=True all keys are drawn into one composite image on a canvas
+    instead of one button per key.
+    """
+
+    _ICON_SIZE: int = 72
     _KEY_COUNT: int = 15
     _KEY_DATA_OFFSET: int = 4
+    _KEY_COLUMNS: int = 5
 
-    def __init__(self) -> None:
+    def __init__(self, canvas: bool = False, pump_interval: float = 1 / 60) -> None:
         super().__init__()
         self._tkwindow = tk.Tk()
+        self._canvas_mode = canvas
+        self._pump_interval = pump_interval
         self._key_btns = []
-        self._key_images = []
-        self._btn_presses = [False] * self._KEY_COUNT
-        self._refresh_images = False
+        # button mode: one photo per key which is updated in place
+        self._key_photos: list[itk.PhotoImage] = []
+        # canvas mode: all keys in one photo, changed keys are copied in through a staging photo
+        self._composite: tk.PhotoImage | None = None
+        self._staging_photo: itk.PhotoImage | None = None
+        self._key_images: list[Image.Image] = [Sprites.CLEAR] * self._KEY_COUNT
+        self._dirty_keys: set[int] = set()
+        self._btn_presses = 0
 
         self._setup_window()
 
@@ -28,64 +47,110 @@ class VirtualDeckMk2(StreamDeck):
         self._tkwindow.title("VirtualDeck Mk.2 3x5")
         self._tkwindow.protocol("WM_DELETE_WINDOW", self.stop)
 
-        # Create the key buttons. each button is a 70x70 square and contains an image
+        if self._canvas_mode:
+            self._setup_canvas()
+        else:
+            self._setup_buttons()
+
+        # Create centered title label
+        title = tk.Label(self._tkwindow, text="VirtualDeck")
+        title.pack(side=tk.BOTTOM)
+
+    def _setup_buttons(self) -> None:
+        # Create the key buttons. each button is a 72x72 square and contains an image
         self._button_frame = tk.Frame(self._tkwindow)
         self._button_frame.pack(side=tk.TOP)
 
         for i in range(self._KEY_COUNT):
-            key_image = itk.PhotoImage(Sprites.CLEAR)
+            key_photo = itk.PhotoImage(self._fit_image(Sprites.CLEAR))
             key_btn = tk.Button(
                 self._button_frame,
-                image=key_image,
+                image=key_photo,
                 command=self._key_press(i),
             )
 
-            key_btn.grid(row=i // 5, column=i % 5)
+            key_btn.grid(row=i // self._KEY_COLUMNS, column=i % self._KEY_COLUMNS)
             self._key_btns.append(key_btn)
-            self._key_images.append(key_image)
-
-        # Create centered title label
-        title = tk.Label(self._tkwindow, text="VirtualDeck")
-        title.pack(side=tk.BOTTOM)
+            self._key_photos.append(key_photo)
+
+    def _setup_canvas(self) -> None:
+        size = self._ICON_SIZE
+        rows = -(-self._KEY_COUNT // self._KEY_COLUMNS)
+        width, height = self._KEY_COLUMNS * size, rows * size
+        self._composite = tk.PhotoImage(master=self._tkwindow, width=width, height=height)
+        self._staging_photo = itk.PhotoImage("RGB", (size, size))
+
+        self._canvas = tk.Canvas(self._tkwindow, width=width, height=height, highlightthickness=0)
+        self._canvas.create_image(0, 0, image=self._composite, anchor=tk.NW)
+        self._canvas.bind("<Button-1>", self._canvas_click)
+        self._canvas.pack(side=tk.TOP)
+        # the composite starts out blank
+        self._dirty_keys.update(range(self._KEY_COUNT))
 
     def __str__(self) -> str:
         return super().__str__()
 
     def _key_press(self, key: int) -> Callable:
         def pressed() -> None:
-            self._btn_presses[key] = True
+            self._btn_presses |= 1 << key
 
         return pressed
 
+    def _canvas_click(self, event) -> None:
+        column, row = event.x // self._ICON_SIZE, event.y // self._ICON_SIZE
+        key = row * self._KEY_COLUMNS + column
+        if 0 <= column < self._KEY_COLUMNS and 0 <= key < self._KEY_COUNT:
+            self._btn_presses |= 1 << key
+
     def set_brightness(self, percentage: int) -> None:
         super().set_brightness(percentage)
 
     def set_standby_timeout(self, timeout_secs: int) -> None:
         super().set_standby_timeout(timeout_secs)
 
-    def set_key_image(self, key: int, image: Image.Image) -> bool:
-        if 0 <= key and key >= self._KEY_COUNT:
+    def set_key_image(self, key: int, image: Image.Image | DeviceImage) -> bool:
+        if not 0 <= key < self._KEY_COUNT:
             return False
 
-        if image:
-            self._key_images[key] = image.rotate(180)
-        else:
-            self._key_images[key] = Sprites.CLEAR
-        self._refresh_images = True
+        if isinstance(image, DeviceImage):
+            image = image.image
+        elif not image:
+            image = Sprites.CLEAR
+        # drawn with the next pump of the Tk event loop
+        self._key_images[key] = image
+        self._dirty_keys.add(key)
         return True
 
-    def _get_data(self) -> list[bool] | None:
-        if self._refresh_images:
-            for key in range(self._KEY_COUNT):
-                image = self._key_images[key]
-                if type(image) != itk.PhotoImage:
-                    self._key_images[key] = itk.PhotoImage(image)
-                self._key_btns[key].config(image=self._key_images[key])
-            self._refresh_images = False
+    def _fit_image(self, image: Image.Image) -> Image.Image:
+        if image.size != (self._ICON_SIZE, self._ICON_SIZE):
+            return image.resize((self._ICON_SIZE, self._ICON_SIZE))
+        return image
+
+    def _render_dirty_keys(self) -> None:
+        dirty_keys, self._dirty_keys = self._dirty_keys, set()
+        for key in sorted(dirty_keys):
+            image = self._fit_image(self._key_images[key])
+            if self._composite is None:
+                self._key_photos[key].paste(image)
+                continue
+            self._staging_photo.paste(image)
+            x = key % self._KEY_COLUMNS * self._ICON_SIZE
+            y = key // self._KEY_COLUMNS * self._ICON_SIZE
+            self._tkwindow.tk.call(self._composite.name, "copy", str(self._staging_photo), "-to", x, y)
+
+    async def _reports(self) -> AsyncIterator[int]:
+        # the window is pumped on a timer instead of every poll, so reading keys stays cheap
+        while self._running:
+            yield self._get_data()
+            await asyncio.sleep(self._pump_interval)
+
+    def _get_data(self) -> int | None:
+        if self._dirty_keys:
+            self._render_dirty_keys()
 
         self._tkwindow.update()
-        keys = self._btn_presses.copy()
-        self._btn_presses = [False] * self._KEY_COUNT
+        keys = self._btn_presses
+        self._btn_presses = 0
         return keys
 
     def __del__(self):
@@ -0,0 +1,80 @@
+import logging
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Callable
+
+from PIL import Image
+
+from sd_controls.deviceimage import DeviceImage
+
+
+class KeyImageWriter:
+    """
+    Sends key images to a deck from a dedicated thread.
+    Each key has at most one pending image, a newer image replaces a pending one that was not sent yet.
+    """
+
+    def __init__(
+        self, write: Callable[[int, Image.Image | DeviceImage], bool], name: str = "sd-controls-writer"
+    ) -> None:
+        self._write = write
+        self._pending: dict[int, tuple[Image.Image | DeviceImage, Future]] = {}
+        self._condition = Condition()
+        self._running = True
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, key: int, image: Image.Image | DeviceImage) -> Future:
+        return self.submit_many({key: image})[key]
+
+    def submit_many(self, images: dict[int, Image.Image | DeviceImage]) -> dict[int, Future]:
+        futures = {}
+        with self._condition:
+            for key, image in images.items():
+                if key in self._pending:
+                    # coalesce: whoever waits for the superseded image learns the outcome of the newer one
+                    future = self._pending[key][1]
+                else:
+                    future = Future()
+                    if not self._running:
+                        future.set_result(False)
+                        futures[key] = future
+                        continue
+                self._pending[key] = (image, future)
+                futures[key] = future
+            self._condition.notify()
+        return futures
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def close(self, drain: bool = True) -> None:
+        """
+        Stops the writer thread, by default after all pending images were sent
+        """
+        with self._condition:
+            self._running = False
+            if not drain:
+                for _, future in self._pending.values():
+                    future.cancel()
+                self._pending.clear()
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                key = next(iter(self._pending))
+                image, future = self._pending.pop(key)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._write(key, image))
+            except Exception as e:
+                logging.error(f"Error while writing image for key {key}: {e}")
+                future.set_exception(e)
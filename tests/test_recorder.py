@@ -0,0 +1,35 @@
+import hashlib
+
+from sd_controls.fakedevice import FakeHIDDevice
+from sd_controls.profiles import STREAMDECK_MK2
+from sd_controls.recorder import ImageRecord, SessionRecorder, read_session
+from sd_controls.sdsystem import Sprites
+from sd_controls.streamdeck import HardwareStreamDeck
+
+
+def _packets_digest(packets: list[bytes]) -> bytes:
+    digest = hashlib.blake2b(digest_size=8)
+    for packet in packets:
+        digest.update(packet)
+    return digest.digest()
+
+
+def test_recorded_key_images(tmp_path):
+    path = tmp_path / "session.sdrec"
+    device = FakeHIDDevice.for_profile(STREAMDECK_MK2)
+    deck = HardwareStreamDeck(device, STREAMDECK_MK2)
+    recorder = SessionRecorder(path)
+    deck.set_recorder(recorder)
+
+    assert deck.set_key_image(7, Sprites.GOAT)
+    goat_packets = list(device.writes)
+    device.reset()
+    assert deck.set_key_image(3, Sprites.BACK_BTN)
+    back_packets = list(device.writes)
+    recorder.close()
+
+    records = [record for record in read_session(path) if isinstance(record, ImageRecord)]
+    assert [record.key for record in records] == [7, 3]
+    assert [record.digest for record in records] == [_packets_digest(goat_packets), _packets_digest(back_packets)]
+    assert [record.packets for record in records] == [len(goat_packets), len(back_packets)]
+    assert all(record.success for record in records)